@@ -1,61 +1,198 @@
 # admin_views.py
 import streamlit as st
-from services import session_scope, log_action
+from datetime import datetime, timedelta
+from services import session_scope, list_pending_edit_requests, resolve_edit_requests, ConcurrentUpdateError
 from ui_components import page_header
-from models import EditRequest, LoanApplication, User, LoanStatus
+from models import get_pool_metrics
+from audit import query_events
+from fairness import fairness_report, rebuild_aggregates, DISPARATE_IMPACT_THRESHOLD
+from drift import drift_report, RETENTION_DAYS
+
+
+def _request_rows(requests):
+    """One table row per pending request, with a selection checkbox column."""
+    rows = []
+    for req in requests:
+        current = req.loan.application_data if req.loan else {}
+        if req.withdraw_requested:
+            kind, change = "Withdraw", "Withdrawal requested"
+        else:
+            kind = "Edit"
+            change = (
+                f"Expenses {current.get('Monthly_Expenses')} → {req.new_monthly_expenses} | "
+                f"Loans {current.get('Existing_Loans')} → {req.new_existing_loans} | "
+                f"Tenure {current.get('Loan_Tenure_Months')} → {req.new_loan_tenure}"
+            )
+        rows.append({
+            "Select": False,
+            "Request": req.id,
+            "Type": kind,
+            "Loan": req.loan_application_id,
+            "User": req.user_id,
+            "Submitted": req.created_at.strftime("%Y-%m-%d %H:%M"),
+            "Change": change,
+        })
+    return rows
+
+
+def _audit_trail():
+    """Audit events for a date range, across the live table and the archives."""
+    today = datetime.utcnow().date()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        start = st.date_input("From", today - timedelta(days=7), key="audit_from")
+    with col2:
+        end = st.date_input("To", today, key="audit_to")
+    with col3:
+        verb = st.text_input("Verb", key="audit_verb", placeholder="e.g. submit") or None
+
+    events = query_events(
+        datetime.combine(start, datetime.min.time()),
+        datetime.combine(end + timedelta(days=1), datetime.min.time()),
+        verb=verb,
+    )
+    if not events:
+        st.caption("No events in this range.")
+        return
+    st.dataframe(events[::-1], hide_index=True, use_container_width=True)
+
+
+def _fairness_panel():
+    """Per-group fairness metrics from the precomputed aggregates (see fairness.py)."""
+    with session_scope() as s:
+        report = fairness_report(s)
+    if not report:
+        st.caption("No scored or decided applications yet.")
+
+    for attribute, groups in report.items():
+        st.markdown(f"**{attribute.replace('_', ' ')}**")
+        st.dataframe(
+            [
+                {
+                    "Group": g["group"],
+                    "Decided": g["decided"],
+                    "Approval rate": g["approval_rate"],
+                    "Mean score": g["mean_score"],
+                    "Predicted approval rate": g["predicted_approval_rate"],
+                    "Disparate impact": g["disparate_impact"],
+                    "Equal-opportunity gap": g["equal_opportunity_gap"],
+                }
+                for g in groups
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+        flagged = [g["group"] for g in groups
+                   if g["disparate_impact"] is not None and g["disparate_impact"] < DISPARATE_IMPACT_THRESHOLD]
+        if flagged:
+            st.warning(f"Disparate impact below {DISPARATE_IMPACT_THRESHOLD} for: {', '.join(flagged)}")
+
+    st.caption(
+        "Disparate impact: approval rate relative to the best-treated group. "
+        "Equal-opportunity gap: how far the share of approved loans the model also "
+        "predicted as approved trails the best group."
+    )
+    if st.button("Recompute from loans", key="fairness_rebuild"):
+        rebuild_aggregates()
+        st.rerun()
+
+
+DRIFT_WINDOWS = {"Last 24 hours": 24, "Last 7 days": 24 * 7, "Last 30 days": 24 * 30}
+
+
+def _drift_panel():
+    """Recent applications and scores vs. the served model's training data (see drift.py)."""
+    window = st.selectbox("Window", list(DRIFT_WINDOWS), key="drift_window")
+    with session_scope() as s:
+        report = drift_report(s, hours=min(DRIFT_WINDOWS[window], RETENTION_DAYS * 24))
+    if report is None:
+        st.caption("The served model version has no drift reference; retrain the model to create one.")
+        return
+
+    features = sorted(report["features"], key=lambda f: -1 if f["psi"] is None else f["psi"], reverse=True)
+    st.dataframe(
+        [
+            {"Feature": f["feature"], "Applications": f["n"], "PSI": f["psi"], "KS": f["ks"], "Status": f["status"]}
+            for f in features
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+    shifted = [f["feature"] for f in features if f["status"] == "significant"]
+    if shifted:
+        st.warning(f"Significant shift (PSI > 0.25) in: {', '.join(shifted)}")
+
+    feature = st.selectbox("Distribution", [f["feature"] for f in features], key="drift_feature")
+    entry = next(f for f in features if f["feature"] == feature)
+    if entry["live"] is not None:
+        import pandas as pd
+
+        st.bar_chart(
+            pd.DataFrame({"Training": entry["reference"], "Recent": entry["live"]}, index=entry["bins"]),
+            stack=False,
+        )
+    st.caption(f"Model {report['model_version']}, applications first scored since {report['since']} UTC.")
+
 
 def admin_dashboard(user):
     page_header("Admin dashboard", "Approve edits / withdrawals and view system logs.")
 
+    with st.expander("Database connection pool"):
+        st.json(get_pool_metrics())
+
+    with st.expander("Audit trail"):
+        _audit_trail()
+
+    with st.expander("Fairness"):
+        _fairness_panel()
+
+    with st.expander("Data drift"):
+        _drift_panel()
+
+    # Outcome of the last bulk action survives the rerun it triggers
+    flash = st.session_state.pop("admin_flash", None)
+    if flash:
+        st.success(flash)
+
     with session_scope() as s:
-        requests = s.query(EditRequest).filter(EditRequest.status == "pending").order_by(EditRequest.created_at.asc()).all()
+        requests = list_pending_edit_requests(s)
 
     if not requests:
         st.info("No pending requests.")
         return
 
-    for req in requests:
-        st.write(f"Request #{req.id} | Loan: {req.loan_application_id} | By user: {req.user_id}")
-        if req.withdraw_requested:
-            st.write("Withdrawal requested.")
-            if st.button(f"Approve withdraw {req.id}"):
-                with session_scope() as s:
-                    loan = s.query(LoanApplication).get(req.loan_application_id)
-                    if loan:
-                        loan.status = LoanStatus.withdrawn
-                    r = s.query(EditRequest).get(req.id)
-                    r.status = "approved"
-                    log_action(s, user.id, f"Approved withdraw {req.id} for loan {req.loan_application_id}")
-                st.success("Withdrawal approved.")
-                st.rerun()
-            if st.button(f"Reject withdraw {req.id}"):
-                with session_scope() as s:
-                    r = s.query(EditRequest).get(req.id)
-                    r.status = "rejected"
-                    log_action(s, user.id, f"Rejected withdraw {req.id}")
-                st.success("Rejected.")
-                st.rerun()
-        else:
-            st.write(f"Edit proposed → Monthly Expenses: {req.new_monthly_expenses} | Existing Loans: {req.new_existing_loans} | Tenure: {req.new_loan_tenure}")
-            if st.button(f"Approve edit {req.id}"):
-                with session_scope() as s:
-                    loan = s.query(LoanApplication).get(req.loan_application_id)
-                    if loan:
-                        if req.new_monthly_expenses is not None:
-                            loan.application_data["Monthly_Expenses"] = float(req.new_monthly_expenses)
-                        if req.new_existing_loans is not None:
-                            loan.application_data["Existing_Loans"] = int(req.new_existing_loans)
-                        if req.new_loan_tenure is not None:
-                            loan.application_data["Loan_Tenure_Months"] = int(req.new_loan_tenure)
-                    r = s.query(EditRequest).get(req.id)
-                    r.status = "approved"
-                    log_action(s, user.id, f"Approved edit {req.id}")
-                st.success("Edit approved.")
-                st.rerun()
-            if st.button(f"Reject edit {req.id}"):
-                with session_scope() as s:
-                    r = s.query(EditRequest).get(req.id)
-                    r.status = "rejected"
-                    log_action(s, user.id, f"Rejected edit {req.id}")
-                st.success("Edit rejected.")
-                st.rerun()
+    import pandas as pd
+
+    select_all = st.checkbox("Select all", key="admin_select_all")
+    table = pd.DataFrame(_request_rows(requests))
+    table["Select"] = select_all
+
+    edited = st.data_editor(
+        table,
+        key=f"admin_requests_{select_all}",
+        hide_index=True,
+        use_container_width=True,
+        disabled=[col for col in table.columns if col != "Select"],
+    )
+    selected = [int(req_id) for req_id in edited.loc[edited["Select"], "Request"]]
+
+    approve_col, reject_col = st.columns(2)
+    with approve_col:
+        approve = st.button(f"Approve selected ({len(selected)})", disabled=not selected, type="primary")
+    with reject_col:
+        reject = st.button(f"Reject selected ({len(selected)})", disabled=not selected)
+
+    if approve or reject:
+        try:
+            # One transaction for the whole batch
+            with session_scope() as s:
+                applied, skipped = resolve_edit_requests(s, selected, approve=approve, admin_id=user.id)
+        except ConcurrentUpdateError as e:
+            st.warning(str(e))
+            return
+
+        message = f"{'Approved' if approve else 'Rejected'} {len(applied)} request(s)."
+        if skipped:
+            message += f" {len(skipped)} were already handled by another admin."
+        st.session_state["admin_flash"] = message
+        st.rerun()
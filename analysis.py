@@ -7,59 +7,169 @@ Ensures:
 - Human readable SHAP explanations
 """
 
+import io
 import os
-import joblib
+import threading
+import weakref
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
-import shap
-import matplotlib.pyplot as plt
-
-
-# -------------------------
-# File paths for artifacts
-# -------------------------
-MODEL_DIR = os.getenv("MODEL_DIR", "models")
 
-MODEL_PATH = os.path.join(MODEL_DIR, "model.joblib")
-EXPLAINER_PATH = os.path.join(MODEL_DIR, "explainer.joblib")
-FEATURE_NAMES_PATH = os.path.join(MODEL_DIR, "feature_names.joblib")
-NUMERICAL_COLS_PATH = os.path.join(MODEL_DIR, "numerical_cols.joblib")
-CATEGORICAL_COLS_PATH = os.path.join(MODEL_DIR, "categorical_cols.joblib")
+from artifacts import load_artifact
+from compiled_model import CompiledLinearModel, compile_pipeline
+# Version tracking and the pickle-free loaders live in serving.py (no pandas there)
+from serving import (
+    MODEL_DIR,
+    MODEL_FILE,
+    EXPLAINER_FILE,
+    FEATURE_NAMES_FILE,
+    NUMERICAL_COLS_FILE,
+    CATEGORICAL_COLS_FILE,
+    BACKGROUND_MEAN_FILE,
+    COMPILED_MODEL_FILE,
+    DRIFT_REFERENCE_FILE,
+    model_store,
+    artifact_path,
+    load_model,
+    load_exported_model,
+    model_version,
+    load_drift_reference,
+)
+
+# Upper bound for the in-memory cache of rendered SHAP plot images
+PLOT_CACHE_MAX_BYTES = int(os.getenv("PLOT_CACHE_MAX_BYTES", 32 * 1024 * 1024))
 
 
 # -------------------------
 # Load helpers
 # -------------------------
-def load_model():
-    """Load trained model pipeline"""
-    if os.path.exists(MODEL_PATH):
-        return joblib.load(MODEL_PATH)
-    return None
+def load_scoring_model():
+    """
+    Model object for scoring/explaining: the memory-mapped exported model
+    when available (nothing is unpickled), else the sklearn pipeline.
+    Both are accepted by the predict/explain helpers below.
+    """
+    exported = load_exported_model()
+    return exported if exported is not None else load_model()
 
 
 def load_explainer():
-    """Load SHAP explainer if available"""
-    if os.path.exists(EXPLAINER_PATH):
-        try:
-            return joblib.load(EXPLAINER_PATH)
-        except Exception as e:
-            print("❌ ERROR loading explainer:", e)
-            return None
-    return None
+    """
+    Load the explainer for the current model.
+
+    Linear models get the closed-form LinearContributionExplainer, which never
+    imports shap; the pickled SHAP explainer is only loaded for other model types.
+    """
+    exported = load_exported_model()
+    if exported is not None and exported.background_mean is not None:
+        return LinearContributionExplainer(exported.coef, exported.background_mean, exported.intercept)
+
+    linear_explainer = linear_explainer_for(load_model())
+    if linear_explainer is not None:
+        return linear_explainer
+
+    try:
+        return load_artifact(artifact_path(EXPLAINER_FILE))
+    except Exception as e:
+        print("❌ ERROR loading explainer:", e)
+        return None
 
 
 def load_feature_names():
-    if os.path.exists(FEATURE_NAMES_PATH):
-        return joblib.load(FEATURE_NAMES_PATH)
-    return None
+    exported = load_exported_model()
+    if exported is not None and exported.feature_names:
+        return exported.feature_names
+    return load_artifact(artifact_path(FEATURE_NAMES_FILE))
 
 
 def load_numerical_cols():
-    return joblib.load(NUMERICAL_COLS_PATH) if os.path.exists(NUMERICAL_COLS_PATH) else []
+    return load_artifact(artifact_path(NUMERICAL_COLS_FILE), default=[])
 
 
 def load_categorical_cols():
-    return joblib.load(CATEGORICAL_COLS_PATH) if os.path.exists(CATEGORICAL_COLS_PATH) else []
+    return load_artifact(artifact_path(CATEGORICAL_COLS_FILE), default=[])
+
+
+def load_background_mean():
+    """Mean of the transformed training data (the SHAP background), if saved."""
+    mean = load_artifact(artifact_path(BACKGROUND_MEAN_FILE))
+    return None if mean is None else np.asarray(mean, dtype=float).ravel()
+
+
+# -------------------------
+# Linear fast path
+# -------------------------
+class LinearContributionExplainer:
+    """
+    Closed-form SHAP values for a linear classifier on preprocessed features.
+
+    For a linear model the interventional SHAP value of feature j is
+    coef_j * (x_j - mean_j), which is exactly what shap.LinearExplainer computes,
+    so this gives identical numbers without importing the shap package.
+    """
+
+    def __init__(self, coef, mean, intercept=0.0):
+        self.coef = np.asarray(coef, dtype=float).ravel()
+        self.mean = np.asarray(mean, dtype=float).ravel()
+        self.expected_value = float(intercept + self.coef @ self.mean)
+
+    def shap_values(self, X):
+        return (np.asarray(X, dtype=float) - self.mean) * self.coef
+
+
+def linear_explainer_for(model_pipeline):
+    """
+    Returns a LinearContributionExplainer when `model_pipeline` is a
+    preprocessor → binary linear classifier pipeline with saved background means,
+    otherwise None (callers then fall back to the pickled SHAP explainer).
+    """
+    if model_pipeline is None or not hasattr(model_pipeline, "named_steps"):
+        return None
+    if "preprocessor" not in model_pipeline.named_steps:
+        return None
+
+    classifier = model_pipeline.named_steps.get("classifier")
+    coef = getattr(classifier, "coef_", None)
+    intercept = getattr(classifier, "intercept_", None)
+    if coef is None or intercept is None or np.shape(coef)[0] != 1:
+        return None
+
+    mean = load_background_mean()
+    if mean is None or mean.shape[0] != np.shape(coef)[1]:
+        return None
+
+    return LinearContributionExplainer(coef, mean, intercept=float(np.ravel(intercept)[0]))
+
+
+# -------------------------
+# Compiled encoder
+# -------------------------
+# Keyed by the loaded pipeline object; entries go away with retired models
+_compiled = weakref.WeakKeyDictionary()
+_compiled_lock = threading.Lock()
+
+
+def compiled_model_for(model_pipeline):
+    """
+    Verified CompiledLinearModel for `model_pipeline` (built once per loaded
+    artifact), or None when the pipeline must go through sklearn.
+    """
+    if model_pipeline is None:
+        return None
+    if isinstance(model_pipeline, CompiledLinearModel):
+        return model_pipeline
+    with _compiled_lock:
+        if model_pipeline not in _compiled:
+            _compiled[model_pipeline] = compile_pipeline(model_pipeline)
+        return _compiled[model_pipeline]
+
+
+def encode_applications(compiled, applications):
+    """Encoded float32 matrix for application dicts or an input frame."""
+    if isinstance(applications, pd.DataFrame):
+        return compiled.encode_columns(applications, len(applications))
+    return compiled.encode(list(applications))
 
 
 # -------------------------
@@ -69,19 +179,55 @@ def build_input_dataframe(application_data: dict) -> pd.DataFrame:
     """
     Convert input JSON into a model-friendly DataFrame and ensure column alignment.
     """
+    return build_input_dataframe_batch([application_data])
 
-    df = pd.DataFrame([application_data])
+
+def build_input_dataframe_batch(applications) -> pd.DataFrame:
+    """
+    Convert a list of input JSON dicts into one aligned DataFrame (one row per application).
+    Missing columns are filled with the same safe fallback as the single-row path.
+    """
 
     expected_cols = load_numerical_cols() + load_categorical_cols()
 
     # If model was trained with column list, enforce it
     if expected_cols:
-        for col in expected_cols:
-            if col not in df.columns:
-                df[col] = 0  # safe fallback value
-        df = df[expected_cols]
+        rows = [
+            {col: app.get(col, 0) for col in expected_cols}  # safe fallback value
+            for app in applications
+        ]
+        return pd.DataFrame(rows, columns=expected_cols)
+
+    return pd.DataFrame(list(applications))
+
+
+def build_input_dataframe_columns(columns, n_rows) -> pd.DataFrame:
+    """
+    Aligned model input built column-wise from {feature_name: sequence}, e.g.
+    the typed LoanApplication columns, without materialising per-row dicts.
+    Numerical features become float arrays; missing values get the same
+    fallback (0) as the dict path.
+    """
+    numerical_cols = load_numerical_cols()
+    expected_cols = numerical_cols + load_categorical_cols() or list(columns)
+
+    frame = {}
+    for col in expected_cols:
+        values = columns.get(col)
+        if values is None:
+            frame[col] = np.zeros(n_rows, dtype=int)
+        elif col in numerical_cols:
+            frame[col] = np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+        else:
+            frame[col] = np.asarray(values, dtype=object)
+    return pd.DataFrame(frame, columns=expected_cols)
+
 
-    return df
+def _input_frame(applications) -> pd.DataFrame:
+    """Batch helpers accept a prepared input frame or a list of application dicts."""
+    if isinstance(applications, pd.DataFrame):
+        return applications
+    return build_input_dataframe_batch(list(applications))
 
 
 # -------------------------
@@ -91,78 +237,238 @@ def predict_proba_and_class(model_pipeline, application_data):
     """
     Returns tuple: (probability_of_approval, predicted_class)
     """
-    df = build_input_dataframe(application_data)
-    proba = float(model_pipeline.predict_proba(df)[0, 1])
-    pred = int(model_pipeline.predict(df)[0])
-    return proba, pred
+    probas, preds = predict_proba_and_class_batch(model_pipeline, [application_data])
+    return float(probas[0]), int(preds[0])
+
+
+def predict_proba_and_class_batch(model_pipeline, applications):
+    """
+    Scores many applications with a single pipeline pass, through the compiled
+    encoder when the pipeline supports it.
+
+    Returns tuple of numpy arrays: (probabilities_of_approval, predicted_classes)
+    """
+    compiled = compiled_model_for(model_pipeline)
+    if compiled is not None:
+        probas, preds = compiled.predict_proba_and_class(encode_applications(compiled, applications))
+        return probas.astype(float), preds.astype(int)
+
+    df = _input_frame(applications)
+    if df.empty:
+        return np.empty(0, dtype=float), np.empty(0, dtype=int)
+
+    proba_matrix = model_pipeline.predict_proba(df)
+
+    # Derive the class from the same probabilities instead of a second predict() pass
+    classes = np.asarray(model_pipeline.classes_)
+    preds = classes[np.argmax(proba_matrix, axis=1)].astype(int)
+
+    return proba_matrix[:, 1].astype(float), preds
 
 
 # -------------------------
-# SHAP — Visual Bar Chart
+# SHAP — Batch explanations
 # -------------------------
-def shap_bar_plot(explainer, model_pipeline, application_data, feature_names=None, topn=10):
-
-    df = build_input_dataframe(application_data)
+def shap_values_batch(explainer, model_pipeline, applications):
+    """
+    Transforms all applications once and explains the whole matrix in one explainer call.
 
-    try:
-        X_transformed = model_pipeline.named_steps["preprocessor"].transform(df)
-        shap_vals = explainer.shap_values(X_transformed)
-    except Exception as e:
-        raise RuntimeError(f"Unable to generate SHAP values: {e}")
+    Returns a (n_applications, n_features) numpy array of SHAP values.
+    """
+    compiled = compiled_model_for(model_pipeline)
+    if compiled is not None:
+        X_transformed = encode_applications(compiled, applications)
+    else:
+        X_transformed = model_pipeline.named_steps["preprocessor"].transform(_input_frame(applications))
+    shap_vals = explainer.shap_values(X_transformed)
 
     if isinstance(shap_vals, list):
         shap_vals = shap_vals[0]
 
-    shap_vals = np.array(shap_vals).flatten()
+    return np.asarray(shap_vals).reshape(X_transformed.shape[0], -1)
+
+
+def top_contributions(shap_matrix, feature_names=None, topk=10):
+    """
+    Compact per-row explanation: a list (one entry per application) of
+    [(feature_name, shap_value), ...] sorted by absolute impact, strongest first.
+    """
+    shap_matrix = np.atleast_2d(shap_matrix)
+    n_features = shap_matrix.shape[1]
+
+    feature_names = feature_names or load_feature_names() or [f"Feature {i}" for i in range(n_features)]
+
+    # Stable sort keeps the original feature order for ties, like sorted() did
+    order = np.argsort(-np.abs(shap_matrix), axis=1, kind="stable")[:, :topk]
+
+    return [
+        [(feature_names[j], float(row[j])) for j in row_order]
+        for row, row_order in zip(shap_matrix, order)
+    ]
+
+
+def explain_batch(explainer, model_pipeline, applications, feature_names=None, topk=10):
+    """
+    Batch explanation API shared by the plot and text renderers.
+
+    Returns one top-k contribution list per application (see top_contributions).
+    """
+    shap_matrix = shap_values_batch(explainer, model_pipeline, applications)
+    return top_contributions(shap_matrix, feature_names=feature_names, topk=topk)
+
 
-    if feature_names is None:
-        feature_names = load_feature_names() or [f"Feature {i}" for i in range(len(shap_vals))]
+# -------------------------
+# SHAP — Visual Bar Chart
+# -------------------------
+def contributions_bar_plot(contributions, topn=10):
+    """
+    Bar chart for one application's precomputed top contributions.
 
-    paired = list(zip(feature_names, shap_vals))
-    sorted_vals = sorted(paired, key=lambda x: abs(x[1]), reverse=True)[:topn]
+    Built with matplotlib's object-oriented Agg API rather than pyplot, so no
+    global figure registry is touched (thread-safe across Streamlit sessions)
+    and the figure is freed as soon as the caller drops it.
+    """
+    # Lazy: keeps matplotlib off the cold-start path
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
 
-    names, values = zip(*sorted_vals)
+    names, values = zip(*contributions[:topn])
     values = list(values)[::-1]
     names = list(names)[::-1]
 
-    fig, ax = plt.subplots(figsize=(5, len(values) * 0.4 + 1))
+    fig = Figure(figsize=(5, len(values) * 0.4 + 1))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
     ax.barh(names, values)
     ax.set_title("SHAP Feature Importance")
     ax.set_xlabel("Contribution to Model Decision")
-    plt.tight_layout()
+    fig.tight_layout()
 
     return fig
 
 
-# -------------------------
-# SHAP — Human Explanation
-# -------------------------
-def generate_simple_shap_explanation(explainer, model_pipeline, application_data, feature_names=None, topn=3):
+def render_contributions_image(contributions, topn=10, fmt="png"):
     """
-    Produces human-readable bullet points explaining strongest model influences.
+    Renders the contribution bar chart straight to image bytes ("png" or "svg").
     """
+    fig = contributions_bar_plot(contributions, topn=topn)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=100)
+    return buffer.getvalue()
 
-    df = build_input_dataframe(application_data)
 
-    try:
-        X_transformed = model_pipeline.named_steps["preprocessor"].transform(df)
-        shap_vals = explainer.shap_values(X_transformed)
-    except Exception:
-        return "The model could not generate an explanation for this decision."
+def contributions_frame(contributions, topn=10):
+    """
+    Contributions as a one-column DataFrame indexed by feature, for native
+    Streamlit charts that need no matplotlib at all.
+    """
+    names, values = zip(*contributions[:topn])
+    return pd.DataFrame({"Contribution": list(values)}, index=list(names))
 
-    if isinstance(shap_vals, list):
-        shap_vals = shap_vals[0]
 
-    shap_vals = np.array(shap_vals).flatten()
+class PlotImageCache:
+    """
+    Thread-safe LRU cache of rendered plot images, bounded by total bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._images.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return  # never worth evicting everything for one image
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._images[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "images": len(self._images),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Shared by every session in this process
+plot_cache = PlotImageCache(PLOT_CACHE_MAX_BYTES)
+
+
+def cached_contributions_image(cache_key, contributions, topn=10, fmt="png"):
+    """
+    Image bytes for a contribution chart, rendered at most once per cache key.
+    Callers key by (loan id, data version, model version), so edits and model
+    changes naturally produce a new image while old ones age out of the LRU.
+    """
+    key = (cache_key, topn, fmt)
+    data = plot_cache.get(key)
+    if data is None:
+        data = render_contributions_image(contributions, topn=topn, fmt=fmt)
+        plot_cache.put(key, data)
+    return data
+
+
+def shap_bar_plot(explainer, model_pipeline, application_data, feature_names=None, topn=10):
+
+    try:
+        contributions = explain_batch(
+            explainer, model_pipeline, [application_data], feature_names=feature_names, topk=topn
+        )[0]
+    except Exception as e:
+        raise RuntimeError(f"Unable to generate SHAP values: {e}")
 
-    feature_names = feature_names or load_feature_names() or [f"Feature {i}" for i in range(len(shap_vals))]
+    return contributions_bar_plot(contributions, topn=topn)
 
-    formatted = sorted(list(zip(feature_names, shap_vals)), key=lambda x: abs(x[1]), reverse=True)[:topn]
 
+# -------------------------
+# SHAP — Human Explanation
+# -------------------------
+def contributions_explanation(contributions, topn=3):
+    """
+    Human-readable bullet points for one application's precomputed top contributions.
+    """
     explanation = "The decision was influenced most by:\n"
-    for name, val in formatted:
+    for name, val in contributions[:topn]:
         direction = "positive" if val > 0 else "negative"
         clean_name = name.replace("_", " ").capitalize()
         explanation += f"- {clean_name} had a **{direction} impact**\n"
 
     return explanation.strip()
+
+
+def generate_simple_shap_explanation(explainer, model_pipeline, application_data, feature_names=None, topn=3):
+    """
+    Produces human-readable bullet points explaining strongest model influences.
+    """
+
+    try:
+        contributions = explain_batch(
+            explainer, model_pipeline, [application_data], feature_names=feature_names, topk=topn
+        )[0]
+    except Exception:
+        return "The model could not generate an explanation for this decision."
+
+    return contributions_explanation(contributions, topn=topn)
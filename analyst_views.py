@@ -1,31 +1,63 @@
 import streamlit as st
-from services import session_scope, list_pending_loans, log_action
-from ui_components import page_header
+from services import session_scope, list_pending_loans_page, log_action, enqueue_scoring, record_decision
+from ui_components import page_header, current_page_cursor, page_controls
 from analysis import (
-    load_model,
+    load_scoring_model,
     load_explainer,
-    load_feature_names,
-    predict_proba_and_class,
-    shap_bar_plot,
-    generate_simple_shap_explanation
+    model_version,
+    cached_contributions_image,
+    contributions_frame,
+    contributions_explanation
 )
-import matplotlib.pyplot as plt
+from scoring import is_stale, score_loans
+from models import LoanApplication
+
+# Each pending loan renders a plot and a decision form, so keep pages small
+ANALYST_PAGE_SIZE = 10
 
 
 def analyst_dashboard(user):
     page_header("Analyst Dashboard", "Review pending applications and run model analysis.")
 
-    model = load_model()
+    model = load_scoring_model()
     explainer = load_explainer()
-    feature_names = load_feature_names()
+
+    native_charts = st.sidebar.toggle(
+        "Native SHAP charts",
+        value=False,
+        help="Draw contributions with Streamlit's bar chart instead of cached matplotlib images."
+    )
 
     with session_scope() as s:
-        pending = list_pending_loans(s)
+        pending, next_cursor = list_pending_loans_page(
+            s, cursor=current_page_cursor("analyst_queue"), limit=ANALYST_PAGE_SIZE
+        )
+
+        # Scores are computed by scoring_worker.py; loans never scored (or
+        # scored by an older model artifact) are queued for it, not scored here
+        current_version = model_version()
+        stale_ids = {loan.id for loan in pending if is_stale(loan, current_version)}
+        if model is not None:
+            enqueue_scoring(s, stale_ids)
 
     if not pending:
         st.info("No pending loan applications.")
+        page_controls("analyst_queue", None)
         return
 
+    scoring_error = None
+    if stale_ids and model is not None:
+        st.info(f"{len(stale_ids)} application(s) on this page are queued for (re)scoring by the scoring worker.")
+        # Fallback for deployments without a worker process
+        if st.button("Score this page now", key="score_page_now"):
+            try:
+                with session_scope() as s:
+                    score_loans(s.query(LoanApplication).filter(LoanApplication.id.in_(stale_ids)).all())
+            except Exception as e:
+                scoring_error = e
+            else:
+                st.rerun()
+
     for loan in pending:
         st.markdown(f"### Application {loan.id} — submitted {loan.created_at}")
         st.json(loan.application_data)
@@ -37,12 +69,15 @@ def analyst_dashboard(user):
         # --------------------------
         with cols[0]:
             if model is not None:
-                try:
-                    proba, pred = predict_proba_and_class(model, loan.application_data)
-                    st.metric("Approval Probability", f"{proba:.2f}")
-                    st.write("Predicted Decision:", "Approved ✔" if pred == 1 else "Denied ❌")
-                except Exception as e:
-                    st.warning(f"Prediction unavailable: {e}")
+                if loan.score is not None:
+                    st.metric("Approval Probability", f"{loan.score:.2f}")
+                    st.write("Predicted Decision:", "Approved ✔" if loan.predicted_class == 1 else "Denied ❌")
+                    if loan.id in stale_ids:
+                        st.caption(f"Scored by an older model ({loan.model_version}); rescoring queued.")
+                elif loan.id in stale_ids and scoring_error is None:
+                    st.info("Score pending — queued for the scoring worker.")
+                else:
+                    st.warning(f"Prediction unavailable: {scoring_error}")
             else:
                 st.info("No ML model available.")
 
@@ -51,11 +86,23 @@ def analyst_dashboard(user):
         # --------------------------
         with cols[1]:
             if explainer is not None and model is not None:
-                try:
-                    fig = shap_bar_plot(explainer, model, loan.application_data, feature_names=feature_names, topn=6)
-                    st.pyplot(fig)
-                except Exception as e:
-                    st.warning(f"Unable to generate SHAP explanation: {e}")
+                if not loan.top_contributions and loan.id in stale_ids and scoring_error is None:
+                    st.info("Explanation pending — queued for the scoring worker.")
+                else:
+                    try:
+                        if not loan.top_contributions:
+                            raise RuntimeError(f"Unable to generate SHAP values: {scoring_error}")
+                        if native_charts:
+                            st.bar_chart(contributions_frame(loan.top_contributions, topn=6), horizontal=True)
+                        else:
+                            image = cached_contributions_image(
+                                (loan.id, loan.data_version, loan.model_version),
+                                loan.top_contributions,
+                                topn=6
+                            )
+                            st.image(image, caption="SHAP Feature Importance")
+                    except Exception as e:
+                        st.warning(f"Unable to generate SHAP explanation: {e}")
             else:
                 st.info("SHAP explainer not available.")
 
@@ -67,15 +114,9 @@ def analyst_dashboard(user):
             auto_explanation = ""
 
             # Generate SHAP-based plain language bullet points
-            if explainer and model:
+            if loan.top_contributions:
                 try:
-                    raw_text = generate_simple_shap_explanation(
-                        explainer,
-                        model,
-                        loan.application_data,
-                        feature_names=feature_names,
-                        topn=3
-                    )
+                    raw_text = contributions_explanation(loan.top_contributions, topn=3)
 
                     # Convert explanation into clean bullet point lines
                     auto_explanation = "\n" + "\n".join([line for line in raw_text.split("\n") if line.startswith("-")])
@@ -97,21 +138,24 @@ def analyst_dashboard(user):
 
             if st.button(f"Apply Decision for {loan.id}", key=f"apply_{loan.id}"):
                 with session_scope() as s:
-                    db_loan = s.query(type(loan)).get(loan.id)
-
+                    applied = True
                     if decision == "approve":
-                        db_loan.status = "approved"
-                        db_loan.decision = "approved"
-                        db_loan.explanation = explanation
+                        applied = record_decision(s, loan.id, "approved", explanation, model_version=loan.model_version)
 
                     elif decision == "deny":
-                        db_loan.status = "denied"
-                        db_loan.decision = "denied"
-                        db_loan.explanation = explanation
+                        applied = record_decision(s, loan.id, "denied", explanation, model_version=loan.model_version)
 
                     # leave pending → no changes
 
-                    log_action(s, user.id, f"Analyst updated loan {loan.id} with decision: {decision}")
+                    # Not logged when another analyst decided (or the user withdrew) the loan first
+                    if applied:
+                        log_action(s, user.id, f"Analyst updated loan {loan.id} with decision: {decision}",
+                                   verb=f"decide_{decision}", target_type="loan", target_id=loan.id)
 
-                st.success("Decision saved successfully.")
-                st.rerun()
+                if not applied:
+                    st.warning(f"Loan {loan.id} is no longer pending; it was already decided or withdrawn. Nothing was changed.")
+                else:
+                    st.success("Decision saved successfully.")
+                    st.rerun()
+
+    page_controls("analyst_queue", next_cursor)
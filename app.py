@@ -2,7 +2,6 @@ import streamlit as st
 from auth import build_auth_url, exchange_code_for_tokens, decode_id_token
 from models import init_db, User
 from services import session_scope
-import user_views, analyst_views, admin_views
 import os
 
 # ------------------------------
@@ -12,7 +11,7 @@ st.set_page_config(page_title="FairFin - Loan Application Portal", layout="wide"
 st.title("FairFin — Loan Application Portal")
 
 # ------------------------------
-# INIT DATABASE
+# INIT DATABASE (once per process)
 # ------------------------------
 init_db()
 
@@ -108,13 +107,18 @@ if "id_token" in st.session_state and st.session_state["id_token"]:
     # ------------------------------
     # ROLE ROUTING
     # ------------------------------
+    # Views are imported lazily so the analytics stack (pandas, sklearn,
+    # the model artifacts) only loads for the role that needs it.
     if user.role == "user":
+        import user_views
         user_views.user_dashboard(user)
 
     elif user.role == "analyst":
+        import analyst_views
         analyst_views.analyst_dashboard(user)
 
     elif user.role == "admin":
+        import admin_views
         admin_views.admin_dashboard(user)
 
     else:
@@ -0,0 +1,144 @@
+"""
+Process-wide registry for trained model artifacts.
+
+Each artifact is unpickled once per process and shared by every Streamlit
+session and rerun. A cached artifact is only reloaded when its file changes:
+a cheap stat() check on mtime/size runs on every access, and the content hash
+is compared before paying for another joblib.load.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Every registry created in this process, for load_timings()
+_registries = []
+
+
+def _joblib_load(path):
+    # Imported on first use, so pickle-free callers never load joblib
+    import joblib
+    return joblib.load(path)
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hex SHA-256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactRegistry:
+    """
+    Thread-safe cache of loaded artifacts keyed by file path.
+    """
+
+    def __init__(self, loader=_joblib_load):
+        self._loader = loader
+        self._entries = {}
+        self._lock = threading.RLock()
+        _registries.append(self)
+
+    @staticmethod
+    def _signature(stat):
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path, default=None):
+        """
+        Return the artifact stored at `path`, loading it only if it is new or changed.
+        Returns `default` when the file does not exist.
+        """
+        try:
+            signature = self._signature(os.stat(path))
+        except FileNotFoundError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return default
+
+        entry = self._entries.get(path)
+        if entry is not None and entry["signature"] == signature:
+            entry["hits"] += 1
+            return entry["value"]
+
+        with self._lock:
+            # Another thread may have refreshed the entry while we waited
+            entry = self._entries.get(path)
+            if entry is not None and entry["signature"] == signature:
+                entry["hits"] += 1
+                return entry["value"]
+
+            sha256 = file_sha256(path)
+            if entry is not None and entry["sha256"] == sha256:
+                # Touched but identical content → keep the loaded object
+                entry["signature"] = signature
+                entry["hits"] += 1
+                return entry["value"]
+
+            started = time.perf_counter()
+            value = self._loader(path)
+            elapsed = time.perf_counter() - started
+
+            self._entries[path] = {
+                "value": value,
+                "signature": signature,
+                "sha256": sha256,
+                "load_seconds": elapsed,
+                "loaded_at": time.time(),
+                "loads": (entry["loads"] + 1) if entry is not None else 1,
+                "hits": 0,
+            }
+            logger.debug("Loaded artifact %s in %.1f ms", os.path.basename(path), elapsed * 1000)
+            return value
+
+    def sha256(self, path):
+        """Content hash of the currently cached artifact at `path` (None if not loaded)."""
+        entry = self._entries.get(path)
+        return entry["sha256"] if entry is not None else None
+
+    def stats(self):
+        """
+        Load timings and cache counters for every cached artifact.
+        """
+        with self._lock:
+            return [
+                {
+                    "artifact": os.path.basename(path),
+                    "path": path,
+                    "sha256": entry["sha256"],
+                    "load_ms": round(entry["load_seconds"] * 1000, 2),
+                    "loaded_at": entry["loaded_at"],
+                    "loads": entry["loads"],
+                    "hits": entry["hits"],
+                }
+                for path, entry in self._entries.items()
+            ]
+
+    def evict_dir(self, directory):
+        """Drops cached artifacts stored directly in `directory` (e.g. a retired model version)."""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            for path in [p for p in self._entries if os.path.dirname(os.path.abspath(p)) == directory]:
+                del self._entries[path]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every session in this process
+registry = ArtifactRegistry()
+
+
+def load_artifact(path, default=None):
+    return registry.get(path, default)
+
+
+def load_timings():
+    """stats() of every artifact registry in this process (joblib, exported model, JSON)."""
+    return [entry for reg in _registries for entry in reg.stats()]
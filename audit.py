@@ -0,0 +1,503 @@
+"""
+Audit log sink for FairFin.
+
+services.log_action used to INSERT one AuditLog row inside every caller's
+transaction, adding write contention to the hot submit/decision paths.
+In the default "async" mode entries are instead:
+
+- collected on the caller's session and handed over only when that
+  transaction commits (dropped on rollback, so nothing is logged for work
+  that never happened),
+- appended to a per-process spool file, so a crash never loses them,
+- written by a background thread in bulk INSERTs when the buffer fills,
+  every AUDIT_FLUSH_INTERVAL seconds and at interpreter shutdown.
+
+While the database is unavailable, failed batches are kept only in their
+spool files and retried from there. Entries the database rejects outright
+(constraint errors) are set aside in a quarantine-*.jsonl file in the spool
+directory instead of blocking the rest.
+
+Spool files left behind by a dead process (including an earlier process
+with the same pid, as after a container restart) are replayed on startup.
+AUDIT_MODE=sync keeps the original in-transaction insert (handy for tests).
+
+Retention: events older than AUDIT_RETENTION_DAYS are moved, a whole month
+at a time, out of the live table into gzip-compressed JSONL files under
+AUDIT_ARCHIVE_DIR (audit-YYYY-MM.jsonl.gz), so the live table stays small.
+query_events() reads a time range across the live table and the archives.
+
+    python audit.py archive                  # run the retention job
+    python audit.py query --start 2025-01-01 --end 2025-02-01 --verb submit
+"""
+
+import argparse
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert, delete
+from sqlalchemy.exc import DataError, IntegrityError
+
+from models import SessionLocal, AuditLog
+
+AUDIT_MODE = os.environ.get("AUDIT_MODE", "async")  # async|sync
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", 2.0))
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", 500))
+AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", 10000))
+AUDIT_SPOOL_DIR = os.environ.get("AUDIT_SPOOL_DIR", "audit_spool")
+AUDIT_ARCHIVE_DIR = os.environ.get("AUDIT_ARCHIVE_DIR", "audit_archive")
+AUDIT_RETENTION_DAYS = int(os.environ.get("AUDIT_RETENTION_DAYS", 90))
+
+_PENDING_KEY = "audit_pending"
+
+
+# -------------------------
+# Spool file helpers
+# -------------------------
+def _encode(entry):
+    return json.dumps({**entry, "timestamp": entry["timestamp"].isoformat()})
+
+
+def _decode(line):
+    entry = json.loads(line)
+    entry["timestamp"] = datetime.fromisoformat(entry["timestamp"])
+    return entry
+
+
+def _read_spool(path):
+    with open(path, encoding="utf-8") as fh:
+        return [_decode(line) for line in fh if line.strip()]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# -------------------------
+# Background writer
+# -------------------------
+class AuditSink:
+    """
+    Bounded in-memory buffer + spool file + background bulk writer.
+    """
+
+    def __init__(self, session_factory=SessionLocal, spool_dir=AUDIT_SPOOL_DIR,
+                 queue_size=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL):
+        self._session_factory = session_factory
+        self._spool_dir = spool_dir
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+
+        # Guards the spool file and the queue so that the spool always holds
+        # exactly the entries that have been submitted but not yet written
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Spool files whose entries failed to write, oldest first; retried from
+        # disk so a database outage doesn't pile entries up in memory
+        self._unwritten_spools = []
+        self._spool_seq = 0
+        # Tells this sink's spool files apart from a predecessor's with the same
+        # pid (e.g. PID 1 in a restarted container)
+        self._token = uuid.uuid4().hex[:12]
+        self._stop = threading.Event()
+        self._thread = None
+
+        os.makedirs(self._spool_dir, exist_ok=True)
+        self._spool_path = self._new_spool_path()
+        self._quarantine_path = os.path.join(self._spool_dir, f"quarantine-{os.getpid()}-{self._token}.jsonl")
+
+    def _new_spool_path(self):
+        self._spool_seq += 1
+        return os.path.join(self._spool_dir, f"audit-{os.getpid()}-{self._token}-{self._spool_seq}.jsonl")
+
+    def start(self):
+        self.replay_orphaned_spools()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def submit(self, entries):
+        """Spools entries and queues them for the background writer."""
+        if not entries:
+            return
+        with self._lock:
+            with open(self._spool_path, "a", encoding="utf-8") as fh:
+                fh.write("".join(_encode(entry) + "\n" for entry in entries))
+                fh.flush()
+            overflow = self._enqueue(entries)
+
+        while overflow:
+            # Backpressure: the caller pays for a flush instead of growing memory
+            self.flush()
+            with self._lock:
+                overflow = self._enqueue(overflow)
+
+    def _enqueue(self, entries):
+        """Queues what fits and returns the rest."""
+        for i, entry in enumerate(entries):
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                return entries[i:]
+        return []
+
+    def _run(self):
+        next_flush = time.monotonic() + self._flush_interval
+        while not self._stop.is_set():
+            timeout = max(next_flush - time.monotonic(), 0)
+            self._stop.wait(min(timeout, 0.25))
+            if self._queue.qsize() >= self._batch_size or time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self._flush_interval
+
+    def flush(self):
+        """Writes everything buffered so far in bulk INSERTs."""
+        with self._flush_lock:
+            with self._lock:
+                entries = []
+                while True:
+                    try:
+                        entries.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                spools = []
+                if os.path.exists(self._spool_path):
+                    # Everything in this spool file is now in `entries`
+                    spools.append(self._spool_path)
+                    self._spool_path = self._new_spool_path()
+
+            written = self._write_unwritten_spools()
+            if not entries:
+                return written
+            if self._unwritten_spools:
+                # Still failing: queue this batch behind the others, on disk only
+                self._unwritten_spools.extend(spools)
+                return written
+
+            try:
+                written += self._write(entries)
+            except Exception as e:
+                # The spool files are the durable copy; retried on the next flush
+                print("⚠ Audit flush failed, will retry:", e)
+                self._unwritten_spools.extend(spools)
+                return written
+
+            for path in spools:
+                os.remove(path)
+            return written
+
+    def _write_unwritten_spools(self):
+        """Retries spool files that failed to write earlier, one file at a time."""
+        written = 0
+        while self._unwritten_spools:
+            path = self._unwritten_spools[0]
+            try:
+                entries = _read_spool(path)
+                written += self._write(entries) if entries else 0
+            except Exception as e:
+                print("⚠ Audit flush failed, will retry:", e)
+                break
+            os.remove(path)
+            self._unwritten_spools.pop(0)
+        return written
+
+    def _write(self, entries):
+        """Inserts entries, quarantining any the database rejects; returns how many were written."""
+        try:
+            return self._insert(entries)
+        except (IntegrityError, DataError) as e:
+            # One bad row must not block the batch forever: write rows one at a time
+            print("⚠ Audit batch rejected, writing entries one at a time:", e.orig)
+            return self._insert_each(entries)
+
+    def _insert(self, entries):
+        session = self._session_factory()
+        try:
+            for start in range(0, len(entries), self._batch_size):
+                session.execute(insert(AuditLog), entries[start:start + self._batch_size])
+            session.commit()
+            return len(entries)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _insert_each(self, entries):
+        rejected = []
+        session = self._session_factory()
+        try:
+            for entry in entries:
+                try:
+                    with session.begin_nested():
+                        session.execute(insert(AuditLog), [entry])
+                except (IntegrityError, DataError):
+                    rejected.append(entry)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        if rejected:
+            with open(self._quarantine_path, "a", encoding="utf-8") as fh:
+                fh.write("".join(_encode(entry) + "\n" for entry in rejected))
+            print(f"❌ {len(rejected)} audit entries rejected by the database, kept in {self._quarantine_path}")
+        return len(entries) - len(rejected)
+
+    def replay_orphaned_spools(self):
+        """Writes entries spooled by processes that died before flushing them."""
+        for path in sorted(glob.glob(os.path.join(self._spool_dir, "audit-*.jsonl"))):
+            # audit-<pid>-<token>-<seq>.jsonl (audit-<pid>-<seq>.jsonl before tokens)
+            parts = os.path.basename(path)[:-len(".jsonl")].split("-")
+            pid, token = int(parts[1]), parts[2] if len(parts) == 4 else None
+            if token == self._token:
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue  # another live process's spool
+            # Claim the file under one of our own spool names first; when several
+            # processes start at once, only the one whose rename succeeds replays it
+            claimed = self._new_spool_path()
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            self._unwritten_spools.append(claimed)
+        with self._flush_lock:
+            self._write_unwritten_spools()
+
+    def close(self):
+        """Stops the writer thread and flushes what is left."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_sink():
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = AuditSink().start()
+    return _sink
+
+
+# -------------------------
+# Transaction hooks
+# -------------------------
+@event.listens_for(SessionLocal, "after_commit")
+def _hand_over_on_commit(session):
+    entries = session.info.pop(_PENDING_KEY, None)
+    if entries:
+        get_sink().submit(entries)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def record(session, entries):
+    """
+    Records audit entries (dicts of AuditLog column values) for the caller's
+    transaction: inserted immediately in sync mode, or handed to the background
+    writer once the transaction commits in async mode.
+    """
+    now = datetime.utcnow()
+    entries = [{**entry, "timestamp": entry.get("timestamp") or now} for entry in entries]
+    if not entries:
+        return
+
+    if AUDIT_MODE == "sync":
+        session.execute(insert(AuditLog), entries)
+        return
+
+    session.info.setdefault(_PENDING_KEY, []).extend(entries)
+
+
+def flush():
+    """Forces buffered audit entries to the database (no-op in sync mode)."""
+    if AUDIT_MODE != "sync" and _sink is not None:
+        _sink.flush()
+
+
+# -------------------------
+# Retention / archival
+# -------------------------
+EVENT_FIELDS = ["id", "timestamp", "user_id", "verb", "target_type", "target_id", "action"]
+
+
+def _month_start(dt):
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(dt):
+    return _month_start(_month_start(dt) + timedelta(days=32))
+
+
+def archive_path(month, archive_dir=AUDIT_ARCHIVE_DIR):
+    return os.path.join(archive_dir, f"audit-{month:%Y-%m}.jsonl.gz")
+
+
+def _event_dict(row):
+    return {field: getattr(row, field) for field in EVENT_FIELDS}
+
+
+def archive_old_events(retention_days=AUDIT_RETENTION_DAYS, archive_dir=AUDIT_ARCHIVE_DIR,
+                       batch_size=5000, session_factory=SessionLocal):
+    """
+    Moves events from months that ended more than `retention_days` ago into
+    per-month archive files and deletes them from the live table.
+    Returns the number of events archived.
+
+    Each batch is appended to its archive before it is deleted; a crash in
+    between leaves the batch in both places, and query_events() reads each
+    event once.
+    """
+    cutoff = _month_start(datetime.utcnow() - timedelta(days=retention_days))
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = 0
+
+    while True:
+        session = session_factory()
+        try:
+            rows = (
+                session.query(AuditLog)
+                .filter(AuditLog.timestamp < cutoff)
+                .order_by(AuditLog.timestamp, AuditLog.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            by_month = {}
+            for row in rows:
+                by_month.setdefault(_month_start(row.timestamp), []).append(_event_dict(row))
+            for month, events in by_month.items():
+                # Appending adds a gzip member; readers see one continuous stream
+                with gzip.open(archive_path(month, archive_dir), "at", encoding="utf-8") as fh:
+                    fh.write("".join(_encode(event) + "\n" for event in events))
+
+            session.execute(
+                delete(AuditLog)
+                .where(AuditLog.id.in_([row.id for row in rows]))
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+            archived += len(rows)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    return archived
+
+
+def _matches(event, filters):
+    return all(event.get(key) == value for key, value in filters.items() if value is not None)
+
+
+def _event_key(event):
+    return event["id"], event["timestamp"], event["action"]
+
+
+def query_events(start, end, user_id=None, verb=None, target_type=None, target_id=None,
+                 archive_dir=AUDIT_ARCHIVE_DIR, session_factory=SessionLocal):
+    """
+    Returns events with start <= timestamp < end, oldest first, as dicts,
+    from the live table and from the archive files of the months in range.
+
+    An event found in both places (an interrupted archive run) is returned
+    once. Events are matched on (id, timestamp, action), not the id alone:
+    SQLite may hand an archived event's rowid to a new live event once the
+    table has been emptied.
+    """
+    filters = {"user_id": user_id, "verb": verb, "target_type": target_type, "target_id": target_id}
+    events = {}
+
+    month = _month_start(start)
+    while month < end:
+        path = archive_path(month, archive_dir)
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                for line in fh:
+                    event = _decode(line)
+                    if start <= event["timestamp"] < end and _matches(event, filters):
+                        events[_event_key(event)] = event
+        month = _next_month(month)
+
+    session = session_factory()
+    try:
+        query = session.query(AuditLog).filter(AuditLog.timestamp >= start, AuditLog.timestamp < end)
+        for key, value in filters.items():
+            if value is not None:
+                query = query.filter(getattr(AuditLog, key) == value)
+        for row in query.order_by(AuditLog.timestamp, AuditLog.id):
+            event = _event_dict(row)
+            events[_event_key(event)] = event
+    finally:
+        session.close()
+
+    return sorted(events.values(), key=lambda event: (event["timestamp"], event["id"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit log retention and queries.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive = commands.add_parser("archive", help="move old events to compressed archive files")
+    archive.add_argument("--retention-days", type=int, default=AUDIT_RETENTION_DAYS)
+    archive.add_argument("--archive-dir", default=AUDIT_ARCHIVE_DIR)
+
+    query = commands.add_parser("query", help="print events in a time range as JSON lines")
+    query.add_argument("--start", type=datetime.fromisoformat, required=True)
+    query.add_argument("--end", type=datetime.fromisoformat, default=None, help="defaults to now")
+    query.add_argument("--user-id", type=int)
+    query.add_argument("--verb")
+    query.add_argument("--target-type")
+    query.add_argument("--target-id", type=int)
+    query.add_argument("--archive-dir", default=AUDIT_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    from models import init_db
+    init_db()
+
+    if args.command == "archive":
+        moved = archive_old_events(args.retention_days, args.archive_dir)
+        print(f"Archived {moved} audit events to {args.archive_dir}")
+        return
+
+    for event in query_events(
+        args.start, args.end or datetime.utcnow(),
+        user_id=args.user_id, verb=args.verb, target_type=args.target_type,
+        target_id=args.target_id, archive_dir=args.archive_dir,
+    ):
+        print(_encode(event))
+
+
+if __name__ == "__main__":
+    main()
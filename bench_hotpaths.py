@@ -0,0 +1,324 @@
+"""
+Hot-path benchmark for FairFin: scoring, explanations and persistence.
+
+For each data size (default 1k, 100k and 1M loans) a fresh process seeds a
+temporary SQLite database with synthetic applications drawn from the
+training distributions (model_training.generate_synthetic_data), then times:
+
+- predict_proba_and_class          single call / predict_proba_and_class_batch over all rows
+- shap_bar_plot                    single call / explain_batch over all rows (the SHAP work behind the plots)
+- generate_simple_shap_explanation single call / explain_batch + contributions_explanation over all rows
+- save_loan                        one loan per transaction / --batch loans in one transaction
+- list_pending_loans               first keyset page (what the views load) / the full pending list
+- edit_approval                    resolve_edit_requests for one request / for --batch requests
+
+Single calls report p50/p95 over --repeat calls; batches report the median of
+--batch-repeat runs and rows/s. The model is the one served from MODEL_DIR.
+
+Results are written as JSON (--output). With --baseline, each p50 (single)
+and median (batch) is compared with the same entry of a previous results
+file; slower than baseline × (1 + --threshold) and by more than
+--min-delta-ms is a regression, and the exit status is 1.
+
+Usage:
+    python bench_hotpaths.py --sizes 1000 100000 --output hotpaths.json
+    python bench_hotpaths.py --output hotpaths.json --baseline bench_baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+SEED_CHUNK_SIZE = 50000
+
+BENCHMARKS = [
+    "predict_proba_and_class",
+    "shap_bar_plot",
+    "generate_simple_shap_explanation",
+    "save_loan",
+    "list_pending_loans",
+    "edit_approval",
+]
+
+
+def time_call(fn):
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+def single_stats(samples):
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "calls": len(samples),
+    }
+
+
+def batch_stats(samples, rows):
+    ms = statistics.median(samples)
+    return {"ms": round(ms, 3), "rows": rows, "rows_per_s": round(rows / (ms / 1000), 1) if ms else None}
+
+
+# -------------------------
+# Child process: one data size
+# -------------------------
+def seed_database(frame, n_edit_requests):
+    """Bulk-inserts the applications as pending loans plus pending edit requests."""
+    from sqlalchemy import insert
+    from models import init_db, engine, User, LoanApplication, LoanStatus, EditRequest, feature_values
+
+    init_db()
+    with engine.begin() as conn:
+        user_id = conn.execute(insert(User).values(
+            auth0_id="bench|user", name="Bench user", email="user@bench.local", role="user"
+        )).inserted_primary_key[0]
+        admin_id = conn.execute(insert(User).values(
+            auth0_id="bench|admin", name="Bench admin", email="admin@bench.local", role="admin"
+        )).inserted_primary_key[0]
+
+    applications = frame.to_dict("records")
+    for start in range(0, len(applications), SEED_CHUNK_SIZE):
+        rows = [
+            # Core insert skips the ORM hook, so the typed columns are passed here
+            {"user_id": user_id, "status": LoanStatus.pending, "application_data": data, **feature_values(data)}
+            for data in applications[start:start + SEED_CHUNK_SIZE]
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(LoanApplication), rows)
+
+    with engine.begin() as conn:
+        conn.execute(insert(EditRequest), [
+            {"user_id": user_id, "loan_application_id": loan_id, "new_monthly_expenses": 5000.0, "new_existing_loans": 0}
+            for loan_id in (i % len(applications) + 1 for i in range(n_edit_requests))
+        ])
+    return user_id, admin_id
+
+
+def run_child(n_rows, repeat, batch, batch_repeat, full_scan_max, seed):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    from model_training import generate_synthetic_data, TARGET
+    from analysis import (
+        load_scoring_model,
+        load_explainer,
+        load_feature_names,
+        predict_proba_and_class,
+        predict_proba_and_class_batch,
+        shap_bar_plot,
+        generate_simple_shap_explanation,
+        explain_batch,
+        contributions_explanation,
+    )
+    from models import EditRequest
+    from services import session_scope, save_loan, list_pending_loans, list_pending_loans_page, resolve_edit_requests
+
+    model = load_scoring_model()
+    explainer = load_explainer()
+    feature_names = load_feature_names()
+    if model is None or explainer is None:
+        print(json.dumps({"error": "no model/explainer deployed in MODEL_DIR; run model_training.py first"}))
+        return
+
+    frame = generate_synthetic_data(n_rows, seed=seed).drop(columns=[TARGET])
+    batch = min(batch, n_rows)
+    started = time.perf_counter()
+    user_id, admin_id = seed_database(frame, repeat + batch * batch_repeat)
+    seed_s = time.perf_counter() - started
+
+    samples = frame.sample(n=repeat, replace=repeat > n_rows, random_state=seed).to_dict("records")
+    batch_applications = frame.iloc[:batch].to_dict("records")
+    results = {name: {} for name in BENCHMARKS}
+
+    def singles(fn):
+        fn(samples[0])  # warm-up: loads artifacts and caches
+        return single_stats([time_call(lambda app=app: fn(app)) for app in samples])
+
+    def batches(fn, rows):
+        fn()
+        return batch_stats([time_call(fn) for _ in range(batch_repeat)], rows)
+
+    # Scoring
+    results["predict_proba_and_class"]["single"] = singles(lambda app: predict_proba_and_class(model, app))
+    results["predict_proba_and_class"]["batch"] = batches(lambda: predict_proba_and_class_batch(model, frame), n_rows)
+
+    # Explanations
+    def plot(app):
+        fig = shap_bar_plot(explainer, model, app, feature_names=feature_names)
+        plt.close(fig)
+
+    results["shap_bar_plot"]["single"] = singles(plot)
+    results["shap_bar_plot"]["batch"] = batches(
+        lambda: explain_batch(explainer, model, frame, feature_names=feature_names, topk=10), n_rows
+    )
+
+    def explanations():
+        for contributions in explain_batch(explainer, model, frame, feature_names=feature_names, topk=3):
+            contributions_explanation(contributions)
+
+    results["generate_simple_shap_explanation"]["single"] = singles(
+        lambda app: generate_simple_shap_explanation(explainer, model, app, feature_names=feature_names)
+    )
+    results["generate_simple_shap_explanation"]["batch"] = batches(explanations, n_rows)
+
+    # Persistence
+    def save_one(app):
+        with session_scope() as s:
+            save_loan(s, user_id, app)
+
+    def save_many():
+        with session_scope() as s:
+            for app in batch_applications:
+                save_loan(s, user_id, app)
+
+    results["save_loan"]["single"] = singles(save_one)
+    results["save_loan"]["batch"] = batches(save_many, batch)
+
+    def first_page(_):
+        with session_scope() as s:
+            list_pending_loans_page(s)
+
+    def full_list():
+        with session_scope() as s:
+            list_pending_loans(s)
+
+    results["list_pending_loans"]["single"] = singles(first_page)
+    if n_rows <= full_scan_max:
+        results["list_pending_loans"]["batch"] = batches(full_list, n_rows)
+
+    with session_scope() as s:
+        pending = [r for (r,) in s.query(EditRequest.id).filter(EditRequest.status == "pending").order_by(EditRequest.id)]
+    single_ids, batch_ids = pending[:len(samples)], pending[len(samples):]
+
+    def approve(ids):
+        with session_scope() as s:
+            resolve_edit_requests(s, ids, True, admin_id)
+
+    results["edit_approval"]["single"] = single_stats([time_call(lambda i=i: approve([i])) for i in single_ids])
+    chunks = [batch_ids[i:i + batch] for i in range(0, batch * batch_repeat, batch)]
+    results["edit_approval"]["batch"] = batch_stats([time_call(lambda c=c: approve(c)) for c in chunks], batch)
+
+    print(json.dumps({"rows": n_rows, "seed_s": round(seed_s, 2), "results": results}))
+
+
+# -------------------------
+# Parent process: orchestration + baseline comparison
+# -------------------------
+def measure(n_rows, args, env):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", str(n_rows),
+         "--repeat", str(args.repeat), "--batch", str(args.batch), "--batch-repeat", str(args.batch_repeat),
+         "--full-scan-max", str(args.full_scan_max), "--seed", str(args.seed)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # The result is the last JSON line; artifact loaders may print before it
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def flatten(report):
+    """{"<rows>/<benchmark>/<single|batch>": ms} (p50 for single calls, median for batches)."""
+    timings = {}
+    for rows, result in report["results"].items():
+        for name, modes in result["results"].items():
+            for mode, stats in modes.items():
+                timings[f"{rows}/{name}/{mode}"] = stats["p50_ms"] if mode == "single" else stats["ms"]
+    return timings
+
+
+def compare(report, baseline, threshold, min_delta_ms):
+    """Entries present in both runs: (key, baseline ms, current ms, ratio, regressed)."""
+    current, previous = flatten(report), flatten(baseline)
+    rows = []
+    for key in sorted(current.keys() & previous.keys()):
+        old, new = previous[key], current[key]
+        ratio = new / old if old else None
+        regressed = new > old * (1 + threshold) and new - old > min_delta_ms
+        rows.append((key, old, new, ratio, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FairFin scoring, explanation and persistence hot paths.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="loans seeded per run")
+    parser.add_argument("--repeat", type=int, default=50, help="single calls per benchmark (p50/p95)")
+    parser.add_argument("--batch", type=int, default=500, help="loans saved / edit requests approved per batch")
+    parser.add_argument("--batch-repeat", type=int, default=3, help="runs per batch benchmark (median is reported)")
+    parser.add_argument("--full-scan-max", type=int, default=100000,
+                        help="largest size at which the full pending list is loaded")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--baseline", help="compare with a previous --output file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs the baseline (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.repeat, args.batch, args.batch_repeat, args.full_scan_max, args.seed)
+        return
+
+    results = {}
+    for n_rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                AUDIT_SPOOL_DIR=os.path.join(tmp, "audit_spool"),
+            )
+            env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), env.get("PYTHONPATH")]))
+            print(f"Seeding and measuring {n_rows:,} loans...")
+            result = measure(n_rows, args, env)
+        if "error" in result:
+            raise SystemExit(f"❌ {result['error']}")
+        results[str(n_rows)] = result
+
+    report = {
+        "python": sys.version.split()[0],
+        "model_dir": os.getenv("MODEL_DIR", "models"),
+        "repeat": args.repeat,
+        "batch": args.batch,
+        "batch_repeat": args.batch_repeat,
+        "results": results,
+    }
+
+    print(f"{'rows':>9}  {'benchmark':<34}{'p50 ms':>10}{'p95 ms':>10}{'batch ms':>12}{'rows/s':>12}")
+    for rows, result in results.items():
+        for name, modes in result["results"].items():
+            single, batch = modes.get("single", {}), modes.get("batch")
+            print(f"{int(rows):>9,}  {name:<34}{single.get('p50_ms', 0):>10.2f}{single.get('p95_ms', 0):>10.2f}"
+                  + (f"{batch['ms']:>12.1f}{batch['rows_per_s'] or 0:>12,.0f}" if batch else f"{'-':>12}{'-':>12}"))
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        comparison = compare(report, baseline, args.threshold, args.min_delta_ms)
+        regressions = [row for row in comparison if row[4]]
+        print(f"\nCompared {len(comparison)} timings with {args.baseline} (threshold +{args.threshold:.0%}):")
+        for key, old, new, ratio, regressed in comparison:
+            if regressed or (ratio and ratio < 1 / (1 + args.threshold)):
+                marker = "⚠ slower" if regressed else "faster"
+                print(f"  {key:<50}{old:>10.2f} → {new:>10.2f} ms  ({ratio:.2f}x, {marker})")
+        if regressions:
+            raise SystemExit(f"❌ {len(regressions)} regression(s) against {args.baseline}")
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Startup benchmark for the FairFin Streamlit app.
+
+For each role (plus the logged-out login screen) a fresh Python process
+imports Streamlit, renders app.py once (cold) and once more (warm rerun),
+and reports which heavy libraries ended up imported. Running every
+measurement in its own process keeps import caches from leaking between
+roles, so this tracks container/worker spin-up cost.
+
+Usage:
+    python bench_startup.py --repeat 3 --loans 50 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+ROLES = ["login", "user", "analyst", "admin"]
+HEAVY_MODULES = ["pandas", "numpy", "sklearn", "shap", "matplotlib", "joblib"]
+TIMING_KEYS = ["import_ms", "first_render_ms", "rerun_ms", "total_ms"]
+
+
+# -------------------------
+# Child process: one measurement
+# -------------------------
+def _artifact_timings():
+    """{artifact file: load ms} of the model artifacts this role loaded."""
+    if "artifacts" not in sys.modules:
+        return {}
+    from artifacts import load_timings
+    return {entry["artifact"]: entry["load_ms"] for entry in load_timings()}
+
+
+def run_child(role):
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    imported = time.perf_counter()
+
+    at = AppTest.from_file(APP_PATH, default_timeout=300)
+    if role != "login":
+        import jwt
+        at.session_state["id_token"] = jwt.encode(
+            {"sub": f"bench|{role}", "email": f"{role}@bench.local", "name": f"Bench {role}"},
+            "bench-secret",
+            algorithm="HS256",
+        )
+
+    at.run()
+    first_render = time.perf_counter()
+    at.run()
+    rerun = time.perf_counter()
+
+    result = {
+        "role": role,
+        "import_ms": (imported - started) * 1000,
+        "first_render_ms": (first_render - imported) * 1000,
+        "rerun_ms": (rerun - first_render) * 1000,
+        "total_ms": (first_render - started) * 1000,
+        "heavy_modules_loaded": [m for m in HEAVY_MODULES if m in sys.modules],
+        "artifacts_loaded": _artifact_timings(),
+        "errors": [e.value for e in at.error] + [str(ex.message) for ex in at.exception],
+    }
+    print(json.dumps(result))
+
+
+# -------------------------
+# Parent process: seeding + orchestration
+# -------------------------
+def seed_database(database_url, n_loans):
+    os.environ["DATABASE_URL"] = database_url
+    from models import init_db, User, LoanApplication, LoanStatus
+    from services import session_scope
+
+    init_db()
+    with session_scope() as s:
+        users = {}
+        for role in ROLES[1:]:
+            users[role] = User(auth0_id=f"bench|{role}", name=f"Bench {role}", email=f"{role}@bench.local", role=role)
+            s.add(users[role])
+        s.flush()
+
+        for i in range(n_loans):
+            s.add(LoanApplication(
+                user_id=users["user"].id,
+                status=LoanStatus.pending,
+                application_data={
+                    "Loan_Amount": float(50000 + (i * 7919) % 150000),
+                    "Loan_Tenure_Months": [12, 24, 36, 48, 60][i % 5],
+                    "Employment_Type": ["Salaried", "Self-Employed", "Freelancer"][i % 3],
+                    "Annual_Income": float(20000 + (i * 3571) % 130000),
+                    "Credit_Score": 300 + (i * 37) % 551,
+                    "Existing_Loans": i % 4,
+                    "Monthly_Expenses": float(5000 + (i * 1543) % 25000),
+                    "Gender": ["Male", "Female"][i % 2],
+                    "Region": ["Urban", "Rural", "Semi-Urban"][i % 3],
+                },
+            ))
+
+
+def measure(role, env):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", role],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # The result is the last JSON line; artifact loaders may print before it
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    summary = {key: round(statistics.median(r[key] for r in runs), 2) for key in TIMING_KEYS}
+    summary["heavy_modules_loaded"] = runs[-1]["heavy_modules_loaded"]
+    summary["artifacts_loaded"] = runs[-1]["artifacts_loaded"]
+    summary["errors"] = sorted({e for r in runs for e in r["errors"]})
+    summary["runs"] = len(runs)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure FairFin import and first-render time per role.")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per role (median is reported)")
+    parser.add_argument("--loans", type=int, default=50, help="pending loans seeded for the analyst view")
+    parser.add_argument("--roles", nargs="+", default=ROLES, choices=ROLES)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--child", choices=ROLES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        seed_database(database_url, args.loans)
+
+        env = dict(os.environ, DATABASE_URL=database_url)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(APP_PATH), env.get("PYTHONPATH")]))
+
+        results = {}
+        for role in args.roles:
+            results[role] = summarize([measure(role, env) for _ in range(args.repeat)])
+
+    report = {
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "loans": args.loans,
+        "results": results,
+    }
+
+    print(f"{'role':<10}{'import ms':>12}{'first render ms':>18}{'rerun ms':>12}  heavy modules")
+    for role, r in results.items():
+        print(f"{role:<10}{r['import_ms']:>12.1f}{r['first_render_ms']:>18.1f}{r['rerun_ms']:>12.1f}  "
+              f"{', '.join(r['heavy_modules_loaded']) or '-'}")
+        if r["artifacts_loaded"]:
+            print("  artifacts: " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in r["artifacts_loaded"].items()))
+        for error in r["errors"]:
+            print(f"  ⚠ {error}")
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
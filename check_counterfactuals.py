@@ -0,0 +1,77 @@
+"""
+Consistency check for the closed-form counterfactuals.
+
+Draws synthetic applications (model_training.generate_synthetic_data), keeps
+the ones the served linear model denies, and solves each with both
+counterfactual paths: the closed form used for linear models and the
+model-agnostic candidate grid. Every closed-form suggestion must get the
+application approved, and must cost no more than the grid's (the grid only
+tries a subset of the same step-aligned values). Exits non-zero otherwise.
+
+Usage:
+    python check_counterfactuals.py --samples 2000
+"""
+
+import argparse
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare closed-form and grid counterfactual costs.")
+    parser.add_argument("--samples", type=int, default=2000, help="synthetic applications to draw")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="allowed cost excess over the grid")
+    args = parser.parse_args()
+
+    from model_training import generate_synthetic_data, TARGET
+    from analysis import load_model, compiled_model_for
+    from counterfactual import _linear_counterfactual, _grid_counterfactual
+
+    pipeline = load_model()
+    compiled = compiled_model_for(pipeline)
+    if compiled is None:
+        raise SystemExit("❌ The served model is not a linear pipeline; nothing to compare.")
+
+    applications = generate_synthetic_data(args.samples, seed=args.seed).drop(columns=[TARGET]).to_dict("records")
+    _, preds = compiled.predict_proba_and_class(compiled.encode(applications))
+    denied = [app for app, pred in zip(applications, preds) if pred != 1]
+
+    failures = []
+    linear_seconds = grid_seconds = 0.0
+    solved = 0
+    for app in denied:
+        started = time.perf_counter()
+        linear = _linear_counterfactual(compiled, app)
+        linear_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+        grid = _grid_counterfactual(pipeline, app)
+        grid_seconds += time.perf_counter() - started
+
+        if linear is None:
+            if grid is not None:
+                failures.append(("no suggestion, grid found one", app, linear, grid))
+            continue
+        solved += 1
+        changed = {**app, **{feature: new for feature, (_, new) in linear["changes"].items()}}
+        _, pred = compiled.predict_proba_and_class(compiled.encode_one(changed))
+        if pred[0] != 1:
+            failures.append(("suggestion is not approved", app, linear, grid))
+        elif grid is not None and linear["distance"] > grid["distance"] + args.tolerance:
+            failures.append(("costlier than the grid", app, linear, grid))
+
+    print(f"{len(denied)} denied of {len(applications)}; {solved} with a suggestion")
+    print(f"closed form {linear_seconds / max(len(denied), 1) * 1000:.2f} ms, "
+          f"grid {grid_seconds / max(len(denied), 1) * 1000:.2f} ms per application")
+    for reason, app, linear, grid in failures[:10]:
+        print(f"  ⚠ {reason}: {app}")
+        print(f"      closed form {linear}")
+        print(f"      grid        {grid}")
+    if failures:
+        print(f"\n{len(failures)} counterfactual(s) failed the check.")
+        sys.exit(1)
+    print("\nAll closed-form counterfactuals are approved and no costlier than the grid.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Query-plan check for the dashboard queries.
+
+Seeds a throwaway SQLite database (1M loan applications by default), runs
+every query the dashboards and the scoring worker issue through their
+service functions, captures the exact SQL with an engine event, and runs
+EXPLAIN QUERY PLAN on each statement. Exits non-zero if any statement
+falls back to a full table scan or sorts a table without an index.
+
+Usage:
+    python check_query_plans.py --rows 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+STATUSES = ["pending", "approved", "denied", "withdrawn"]
+
+
+# -------------------------
+# Seeding
+# -------------------------
+def seed(db_path, n_rows, n_users):
+    """Bulk-loads rows with the raw sqlite3 driver (ORM inserts are far too slow for 1M rows)."""
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO users (id, auth0_id, name, email, role) VALUES (?, ?, ?, ?, ?)",
+        ((i, f"seed|{i}", f"User {i}", f"user{i}@seed.local", "user") for i in range(1, n_users + 1)),
+    )
+
+    def loans():
+        for i in range(1, n_rows + 1):
+            data = {
+                "Loan_Amount": float(rng.randint(50000, 200000)),
+                "Loan_Tenure_Months": rng.choice([12, 24, 36, 48, 60]),
+                "Employment_Type": rng.choice(["Salaried", "Self-Employed", "Freelancer"]),
+                "Annual_Income": float(rng.randint(20000, 150000)),
+                "Credit_Score": rng.randint(300, 850),
+                "Existing_Loans": rng.randint(0, 3),
+                "Monthly_Expenses": float(rng.randint(5000, 30000)),
+                "Gender": rng.choice(["Male", "Female"]),
+                "Region": rng.choice(["Urban", "Rural", "Semi-Urban"]),
+            }
+            # Most of the book is decided; a small tail is still pending
+            status = "pending" if rng.random() < 0.02 else rng.choice(STATUSES[1:])
+            created = start + timedelta(seconds=i * 30)
+            yield (i, rng.randint(1, n_users), json.dumps(data), status, created.isoformat(sep=" "), 1)
+
+    conn.executemany(
+        "INSERT INTO loan_applications (id, user_id, application_data, status, created_at, data_version) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        loans(),
+    )
+
+    n_requests = max(n_rows // 100, 1)
+    conn.executemany(
+        "INSERT INTO edit_requests (id, user_id, loan_application_id, withdraw_requested, status, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (i, rng.randint(1, n_users), rng.randint(1, n_rows), rng.random() < 0.5,
+             "pending" if rng.random() < 0.05 else "approved",
+             (start + timedelta(seconds=i * 3000)).isoformat(sep=" "))
+            for i in range(1, n_requests + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO scoring_jobs (id, loan_application_id, status, attempts, created_at, updated_at) "
+        "VALUES (?, ?, ?, 0, ?, ?)",
+        (
+            (i, i, "done" if i % 50 else "queued", start.isoformat(sep=" "), start.isoformat(sep=" "))
+            for i in range(1, n_rows // 10 + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO audit_logs (id, user_id, action, timestamp, verb, target_type, target_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            (i, rng.randint(1, n_users), f"Submitted application {i}", (start + timedelta(seconds=i * 30)).isoformat(sep=" "),
+             "submit", "loan", i)
+            for i in range(1, n_rows // 10 + 1)
+        ),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+# -------------------------
+# Capture + explain
+# -------------------------
+def capture_dashboard_queries(archive_dir):
+    """Runs the dashboard/worker service calls and returns [(label, sql, params), ...]."""
+    from sqlalchemy import event
+    from models import engine
+    from services import (
+        session_scope, list_pending_loans_page, list_user_loans_page,
+        list_pending_edit_requests, enqueue_scoring, record_decision, resolve_edit_requests
+    )
+    from audit import query_events
+    from fairness import fairness_report
+    from drift import drift_report
+    import scoring_worker
+
+    captured = []
+    label = {"name": None}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")) and not executemany:
+            captured.append((label["name"], statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with session_scope() as s:
+            label["name"] = "analyst queue: first page"
+            page, cursor = list_pending_loans_page(s, limit=10)
+            label["name"] = "analyst queue: next page"
+            list_pending_loans_page(s, cursor=cursor, limit=10)
+
+            label["name"] = "user history: first page"
+            page, cursor = list_user_loans_page(s, user_id=7, limit=20)
+            label["name"] = "user history: next page"
+            list_user_loans_page(s, user_id=7, cursor=cursor, limit=20)
+
+            label["name"] = "admin: pending edit requests"
+            requests = list_pending_edit_requests(s)
+
+            label["name"] = "admin: approve edit requests"
+            resolve_edit_requests(s, [req.id for req in requests[:20]], approve=True, admin_id=1)
+
+            label["name"] = "admin: fairness panel"
+            fairness_report(s)
+
+            label["name"] = "admin: drift panel"
+            drift_report(s, hours=24)
+
+            label["name"] = "analyst: enqueue stale loans"
+            enqueue_scoring(s, [loan.id for loan in page])
+
+            label["name"] = "analyst: record decision"
+            record_decision(s, page[0].id if page else 1, "approved", "plan check")
+
+            label["name"] = "worker: claim jobs"
+            scoring_worker.claim_jobs(s, "plan-check", batch_size=50)
+
+            s.rollback()
+
+        label["name"] = "admin: audit trail"
+        now = datetime.utcnow()
+        query_events(now - timedelta(days=7), now, archive_dir=archive_dir)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return captured
+
+
+def plan_problems(plan_rows):
+    """Plan lines that mean a full scan of a table or an unindexed sort."""
+    problems = []
+    for row in plan_rows:
+        detail = row[-1]
+        if detail.startswith("SCAN ") and "INDEX" not in detail:
+            problems.append(detail)
+        elif "USE TEMP B-TREE FOR ORDER BY" in detail:
+            problems.append(detail)
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if a dashboard query does a full table scan.")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="loan applications to seed")
+    parser.add_argument("--users", type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "plans.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+        from models import init_db, engine
+        init_db()
+
+        started = time.perf_counter()
+        seed(db_path, args.rows, args.users)
+        print(f"Seeded {args.rows:,} loan applications in {time.perf_counter() - started:.1f}s")
+
+        failures = 0
+        with engine.connect() as conn:
+            for label, statement, params in capture_dashboard_queries(os.path.join(tmp, "audit_archive")):
+                plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params).all()
+                problems = plan_problems(plan)
+                status = "FAIL" if problems else "ok"
+                print(f"[{status:>4}] {label}")
+                for row in plan:
+                    print(f"         {row[-1]}")
+                failures += bool(problems)
+        engine.dispose()
+
+    if failures:
+        print(f"\n{failures} statement(s) fall back to full scans or unindexed sorts.")
+        sys.exit(1)
+    print("\nAll dashboard queries use indexes.")
+
+
+if __name__ == "__main__":
+    main()
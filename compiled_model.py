@@ -0,0 +1,295 @@
+"""
+Compiled linear scorer for FairFin.
+
+The deployed pipeline (ColumnTransformer of StandardScaler + OneHotEncoder,
+then LogisticRegression) is reduced to plain arrays: scaler means/scales,
+category → column maps and the coefficient vector. Applications are encoded
+straight from dicts or column batches into a preallocated float32 matrix, so
+scoring one application skips the pandas DataFrame and the generic
+ColumnTransformer machinery entirely. Only numpy is needed at scoring time.
+
+compile_pipeline() checks the compiled encoder against the sklearn pipeline
+before it is used; pipelines of any other shape are left to sklearn.
+
+On disk a compiled model is pickle-free: a small JSON manifest
+(linear_model.json: columns, feature names, intercept, classes) next to
+plain .npy arrays (coefficients, scaler stats, category vocabularies, SHAP
+background means). load() memory-maps the arrays, so worker processes share
+the pages through the OS cache instead of each unpickling a copy.
+"""
+
+import json
+import os
+
+import numpy as np
+
+ARTIFACT_FORMAT = "fairfin-linear/1"
+
+# Probability agreement required between the compiled scorer and sklearn
+# (the encoded matrix is float32, the dot product runs in float64)
+VERIFY_ATOL = 1e-5
+
+
+class CompiledLinearModel:
+    """
+    Arrays-only equivalent of a preprocessor → binary LogisticRegression pipeline.
+    """
+
+    def __init__(self, numerical_cols, means, scales, categorical_cols, categories,
+                 coef, intercept, classes, feature_names=None, background_mean=None):
+        self.numerical_cols = list(numerical_cols)
+        self.means = np.asarray(means, dtype=np.float32)
+        self.scales = np.asarray(scales, dtype=np.float32)
+        self.categorical_cols = list(categorical_cols)
+        self.categories = [list(values) for values in categories]
+        self.coef = np.asarray(coef, dtype=np.float64).ravel()
+        self.intercept = float(intercept)
+        self.classes = np.asarray(classes)
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        # SHAP background (mean of the transformed training data), if exported
+        self.background_mean = (
+            np.asarray(background_mean, dtype=np.float64).ravel() if background_mean is not None else None
+        )
+
+        # Column offset of each one-hot block and its category → position map
+        self._offsets = []
+        self._index = []
+        offset = len(self.numerical_cols)
+        for values in self.categories:
+            self._offsets.append(offset)
+            self._index.append({value: i for i, value in enumerate(values)})
+            offset += len(values)
+        self.n_features = offset
+
+        if self.coef.shape[0] != self.n_features:
+            raise ValueError(f"{self.coef.shape[0]} coefficients for {self.n_features} encoded features")
+
+    # -------------------------
+    # Export
+    # -------------------------
+    @classmethod
+    def from_pipeline(cls, pipeline, feature_names=None, background_mean=None):
+        """
+        Extracts the arrays from a fitted pipeline, or returns None when the
+        pipeline is not a StandardScaler/OneHotEncoder → binary linear model.
+        """
+        steps = getattr(pipeline, "named_steps", {})
+        preprocessor = steps.get("preprocessor")
+        classifier = steps.get("classifier")
+        coef = getattr(classifier, "coef_", None)
+        if preprocessor is None or coef is None or np.shape(coef)[0] != 1:
+            return None
+        if getattr(preprocessor, "remainder", "drop") != "drop":
+            return None
+
+        numerical_cols, means, scales = [], None, None
+        categorical_cols, categories = [], []
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == "drop" or len(columns) == 0:
+                continue
+            kind = type(transformer).__name__
+            if kind == "StandardScaler" and not numerical_cols:
+                numerical_cols = list(columns)
+                n = len(numerical_cols)
+                means = transformer.mean_ if transformer.with_mean else np.zeros(n)
+                scales = transformer.scale_ if transformer.with_std else np.ones(n)
+            elif (kind == "OneHotEncoder" and not categorical_cols
+                    and transformer.drop is None and transformer.handle_unknown == "ignore"
+                    and getattr(transformer, "min_frequency", None) is None
+                    and getattr(transformer, "max_categories", None) is None):
+                categorical_cols = list(columns)
+                categories = [[value.item() if hasattr(value, "item") else value for value in values]
+                              for values in transformer.categories_]
+            else:
+                return None
+            # Output order must be numerical block first, then one-hot block
+            if kind == "OneHotEncoder" and not numerical_cols:
+                return None
+
+        return cls(
+            numerical_cols, means if means is not None else [], scales if scales is not None else [],
+            categorical_cols, categories,
+            coef=np.ravel(coef),
+            intercept=np.ravel(classifier.intercept_)[0],
+            classes=classifier.classes_,
+            feature_names=feature_names,
+            background_mean=background_mean,
+        )
+
+    def save(self, manifest_path):
+        """Writes the JSON manifest and the .npy arrays next to it."""
+        directory = os.path.dirname(manifest_path)
+        arrays = {
+            "means": ("scaler_mean.npy", self.means),
+            "scales": ("scaler_scale.npy", self.scales),
+            "coef": ("coef.npy", self.coef),
+        }
+        if self.background_mean is not None:
+            arrays["background_mean"] = ("background_mean.npy", self.background_mean)
+        for col, values in zip(self.categorical_cols, self.categories):
+            arrays[f"categories:{col}"] = (f"categories_{col}.npy", np.asarray(values))
+
+        for name, array in arrays.values():
+            np.save(os.path.join(directory, name), array, allow_pickle=False)
+
+        manifest = {
+            "format": ARTIFACT_FORMAT,
+            "numerical_cols": self.numerical_cols,
+            "categorical_cols": self.categorical_cols,
+            "feature_names": self.feature_names,
+            "intercept": self.intercept,
+            "classes": self.classes.tolist(),
+            "arrays": {key: name for key, (name, _) in arrays.items()},
+        }
+        with open(manifest_path, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh, indent=2)
+
+    @classmethod
+    def load(cls, manifest_path):
+        """Loads a saved model with its arrays memory-mapped read-only."""
+        with open(manifest_path, encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        if manifest.get("format") != ARTIFACT_FORMAT:
+            raise ValueError(f"Unsupported model artifact format: {manifest.get('format')}")
+
+        directory = os.path.dirname(manifest_path)
+        files = manifest["arrays"]
+
+        def array(key):
+            if key not in files:
+                return None
+            return np.load(os.path.join(directory, files[key]), mmap_mode="r", allow_pickle=False)
+
+        return cls(
+            manifest["numerical_cols"], array("means"), array("scales"),
+            manifest["categorical_cols"],
+            [array(f"categories:{col}").tolist() for col in manifest["categorical_cols"]],
+            coef=array("coef"),
+            intercept=manifest["intercept"],
+            classes=manifest["classes"],
+            feature_names=manifest.get("feature_names"),
+            background_mean=array("background_mean"),
+        )
+
+    # -------------------------
+    # Encoding
+    # -------------------------
+    def _output(self, n_rows, out):
+        if out is None:
+            return np.empty((n_rows, self.n_features), dtype=np.float32)
+        if out.shape[0] < n_rows or out.shape[1] != self.n_features or out.dtype != np.float32:
+            raise ValueError(f"out must be float32 with shape ({n_rows}+, {self.n_features})")
+        return out[:n_rows]
+
+    def _finish(self, X, category_indexes):
+        n_num = len(self.numerical_cols)
+        if n_num:
+            X[:, :n_num] -= self.means
+            X[:, :n_num] /= self.scales
+        X[:, n_num:] = 0.0
+        rows = np.arange(X.shape[0])
+        for offset, idx in zip(self._offsets, category_indexes):
+            known = idx >= 0  # unknown categories encode as all zeros, like handle_unknown="ignore"
+            X[rows[known], offset + idx[known]] = 1.0
+        return X
+
+    def encode(self, records, out=None):
+        """
+        Encodes a sequence of application dicts into a (n, n_features) float32
+        matrix, written into `out` when a large enough buffer is passed.
+        Missing or empty numerical values count as 0, like the DataFrame path.
+        """
+        records = records if isinstance(records, (list, tuple)) else list(records)
+        X = self._output(len(records), out)
+        for j, col in enumerate(self.numerical_cols):
+            X[:, j] = [record.get(col) or 0 for record in records]
+        category_indexes = [
+            np.fromiter((index.get(record.get(col), -1) for record in records), dtype=np.intp, count=len(records))
+            for col, index in zip(self.categorical_cols, self._index)
+        ]
+        return self._finish(X, category_indexes)
+
+    def encode_one(self, record, out=None):
+        return self.encode([record], out=out)
+
+    def encode_columns(self, columns, n_rows, out=None):
+        """
+        Encodes a column batch ({feature: sequence}, or a DataFrame) of
+        `n_rows` applications, without going through per-row dicts.
+        """
+        X = self._output(n_rows, out)
+        for j, col in enumerate(self.numerical_cols):
+            if col in columns:
+                X[:, j] = np.nan_to_num(np.asarray(columns[col], dtype=np.float64), nan=0.0)
+            else:
+                X[:, j] = 0.0
+        category_indexes = []
+        for col, index in zip(self.categorical_cols, self._index):
+            values = columns[col] if col in columns else [None] * n_rows
+            category_indexes.append(np.fromiter((index.get(v, -1) for v in values), dtype=np.intp, count=n_rows))
+        return self._finish(X, category_indexes)
+
+    # -------------------------
+    # Scoring
+    # -------------------------
+    def decision_function(self, X):
+        return np.asarray(X) @ self.coef + self.intercept
+
+    def predict_proba(self, X):
+        """Probability of the positive class (classes[1]) per encoded row."""
+        return 1.0 / (1.0 + np.exp(-self.decision_function(X)))
+
+    def predict_proba_and_class(self, X):
+        """(probabilities, predicted classes), matching the pipeline's argmax."""
+        probas = self.predict_proba(X)
+        preds = self.classes[(probas > 0.5).astype(int)]
+        return probas, preds
+
+
+# -------------------------
+# Verification
+# -------------------------
+def probe_records(compiled, n_rows=32, seed=0):
+    """Synthetic applications spanning every category and ±3 std of each numerical feature."""
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(n_rows):
+        record = {
+            col: float(mean + scale * rng.uniform(-3, 3))
+            for col, mean, scale in zip(compiled.numerical_cols, compiled.means, compiled.scales)
+        }
+        for col, values in zip(compiled.categorical_cols, compiled.categories):
+            record[col] = values[i % len(values)]
+        records.append(record)
+    return records
+
+
+def max_probability_error(compiled, pipeline, records):
+    """Largest |P_compiled - P_sklearn| over `records` (dicts)."""
+    import pandas as pd
+
+    cols = compiled.numerical_cols + compiled.categorical_cols
+    frame = pd.DataFrame([{col: record.get(col, 0) for col in cols} for record in records], columns=cols)
+    expected = pipeline.predict_proba(frame)[:, 1]
+    actual = compiled.predict_proba(compiled.encode(records))
+    return float(np.max(np.abs(actual - expected)))
+
+
+def compile_pipeline(pipeline, records=None, atol=VERIFY_ATOL, feature_names=None, background_mean=None):
+    """
+    CompiledLinearModel for `pipeline`, verified against sklearn on `records`
+    (synthetic probes by default). Returns None if unsupported or mismatched.
+    """
+    try:
+        compiled = CompiledLinearModel.from_pipeline(pipeline, feature_names, background_mean)
+        if compiled is None:
+            return None
+        error = max_probability_error(compiled, pipeline, records or probe_records(compiled))
+    except Exception as e:
+        print("⚠ Could not compile model pipeline:", e)
+        return None
+
+    if error > atol:
+        print(f"⚠ Compiled model disagrees with the pipeline (max error {error:.2e}); using sklearn.")
+        return None
+    return compiled
@@ -0,0 +1,277 @@
+"""
+What-if counterfactuals for denied applications.
+
+find_counterfactual() looks for the smallest change to the fields an
+applicant can act on (the ones an EditRequest covers, plus the loan amount)
+that turns the model's prediction into an approval. Size is the L1 distance
+in units of each feature's training standard deviation, so a change of
+one typical spread costs the same for every field.
+
+- Linear models (the deployed StandardScaler/OneHotEncoder → logistic
+  regression): each field moves the logit by coef / scale per unit. Every
+  combination of step-grid values of all fields but the widest one is
+  scored in one vectorized pass, and for each the widest field is moved in
+  closed form just far enough past the boundary, so the result is the
+  cheapest approved point on the fields' step grids.
+- Any other model: one batched predict over a grid of candidate values
+  (thousands of rows, a single call), keeping the cheapest approved one.
+
+Both paths are sub-millisecond to a few milliseconds, fast enough to run
+while rendering user_views.
+"""
+
+import itertools
+from functools import lru_cache
+
+import numpy as np
+
+# Actionable fields: lower bound, step, and whether only reductions are offered
+# (the form's own limits; the tenure is one of the offered terms)
+EDITABLE_FEATURES = {
+    "Monthly_Expenses": {"min": 0, "step": 500, "reduce_only": True},
+    "Existing_Loans": {"min": 0, "step": 1, "reduce_only": True},
+    "Loan_Amount": {"min": 1000, "step": 1000, "reduce_only": True},
+    "Loan_Tenure_Months": {"choices": [12, 24, 36, 48, 60]},
+}
+
+# Decision threshold of the model's predicted class
+APPROVAL_PROBABILITY = 0.5
+# Grid resolution of the model-agnostic search, and its size cap (one predict call)
+GRID_LEVELS = 12
+MAX_CANDIDATES = 20000
+
+
+def _value(application, feature):
+    try:
+        return float(application.get(feature) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _candidate_values(spec, current, levels):
+    """Values a field may take, the current one included."""
+    if "choices" in spec:
+        return sorted(set(spec["choices"]) | {current})
+    low = spec["min"]
+    high = current if spec.get("reduce_only") else max(current, low)
+    if high <= low:
+        return [current]
+    step = spec["step"]
+    values = np.unique(np.ceil(np.linspace(low, high, levels) / step) * step)
+    return sorted({float(min(max(v, low), high)) for v in values} | {low, current})
+
+
+def _plain(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _result(application, candidate, probability, cost):
+    changes = {
+        feature: (application.get(feature), _plain(candidate[feature]))
+        for feature in EDITABLE_FEATURES
+        if _value(application, feature) != candidate[feature]
+    }
+    return {"changes": changes, "probability": float(probability), "distance": float(cost)}
+
+
+# -------------------------
+# Linear models: closed form
+# -------------------------
+def _field_values(spec, current):
+    """Every value a bounded field may take: its step grid within bounds, plus the current value."""
+    if "choices" in spec:
+        return np.array(sorted(set(spec["choices"]) | {current}), dtype=float)
+    low, step = spec["min"], spec["step"]
+    if current <= low:
+        return np.array([current], dtype=float)
+    grid = np.arange(np.ceil(low / step) * step, current, step)
+    return np.unique(np.concatenate([[low], grid, [current]]).astype(float))
+
+
+def _linear_counterfactual(compiled, application):
+    index = {col: i for i, col in enumerate(compiled.numerical_cols)}
+    if any(feature not in index for feature in EDITABLE_FEATURES):
+        return None
+
+    z0 = float(compiled.decision_function(compiled.encode_one(application))[0])
+    # Logit change per unit of each field, and the field's cost per unit
+    gain = {f: compiled.coef[index[f]] / compiled.scales[index[f]] for f in EDITABLE_FEATURES}
+    unit_cost = {f: 1.0 / compiled.scales[index[f]] for f in EDITABLE_FEATURES}
+    current = {f: _value(application, f) for f in EDITABLE_FEATURES}
+    values = {f: _field_values(spec, current[f]) for f, spec in EDITABLE_FEATURES.items()}
+
+    # Every combination of the other fields, with the widest stepped one solved exactly
+    solved = max((f for f, spec in EDITABLE_FEATURES.items() if "choices" not in spec), key=lambda f: len(values[f]))
+    enumerated = [f for f in EDITABLE_FEATURES if f != solved]
+    columns = dict(zip(enumerated, (a.ravel() for a in np.meshgrid(*(values[f] for f in enumerated), indexing="ij"))))
+    z = z0 + sum(gain[f] * (columns[f] - current[f]) for f in enumerated)
+    cost = sum(np.abs(columns[f] - current[f]) * unit_cost[f] for f in enumerated)
+
+    # Smallest move of the solved field just past the boundary, on its step grid
+    spec, g, x = EDITABLE_FEATURES[solved], gain[solved], current[solved]
+    need = np.where(z > 0, 0.0, -z / abs(g) + 1e-9) if g else np.zeros_like(z)
+    if g < 0:
+        lowered = np.maximum(np.floor((x - need) / spec["step"]) * spec["step"], spec["min"])
+        moved = np.where(need > 0, np.clip(x - lowered, 0.0, max(x - spec["min"], 0.0)), 0.0)
+    elif g > 0 and not spec.get("reduce_only"):
+        moved = np.where(need > 0, np.ceil((x + need) / spec["step"]) * spec["step"] - x, 0.0)
+    else:
+        moved = np.zeros_like(z)
+    z = z + abs(g) * moved
+    cost = cost + moved * unit_cost[solved]
+
+    feasible = np.flatnonzero(z > 0)
+    if len(feasible) == 0:
+        return None
+    # Cheapest combination; the more confident one on ties
+    best = feasible[np.lexsort((-z[feasible], cost[feasible]))[0]]
+    candidate = {f: float(columns[f][best]) for f in enumerated}
+    candidate[solved] = x - moved[best] if g < 0 else x + moved[best]
+    probability = float(compiled.predict_proba(compiled.encode_one({**application, **candidate}))[0])
+    if probability <= APPROVAL_PROBABILITY:
+        return None
+    return _result(application, candidate, probability, float(cost[best]))
+
+
+# -------------------------
+# Other models: batched grid search
+# -------------------------
+def _feature_scales(model, features, application):
+    """Training std of each field from the pipeline's StandardScaler, else its candidate range."""
+    scales = {}
+    try:
+        preprocessor = model.named_steps["preprocessor"]
+        for _, transformer, columns in preprocessor.transformers_:
+            if type(transformer).__name__ == "StandardScaler" and getattr(transformer, "scale_", None) is not None:
+                scales.update(zip(columns, transformer.scale_))
+    except (AttributeError, KeyError):
+        pass
+    for feature in features:
+        if not scales.get(feature):
+            values = _candidate_values(EDITABLE_FEATURES[feature], _value(application, feature), GRID_LEVELS)
+            scales[feature] = max(max(values) - min(values), 1.0)
+    return scales
+
+
+def _grid_counterfactual(model, application):
+    from analysis import predict_proba_and_class_batch, build_input_dataframe_columns
+
+    features = list(EDITABLE_FEATURES)
+    current = {f: _value(application, f) for f in features}
+
+    levels = GRID_LEVELS
+    while True:
+        grids = [_candidate_values(EDITABLE_FEATURES[f], current[f], levels) for f in features]
+        if np.prod([len(g) for g in grids]) <= MAX_CANDIDATES or levels <= 2:
+            break
+        levels -= 2
+
+    candidates = np.array(list(itertools.product(*grids)), dtype=float)
+    n = len(candidates)
+    columns = {key: [value] * n for key, value in application.items()}
+    columns.update({f: candidates[:, j] for j, f in enumerate(features)})
+    probas, preds = predict_proba_and_class_batch(model, build_input_dataframe_columns(columns, n))
+
+    scales = _feature_scales(model, features, application)
+    costs = sum(np.abs(candidates[:, j] - current[f]) / scales[f] for j, f in enumerate(features))
+    approved = np.flatnonzero(preds == 1)
+    if len(approved) == 0:
+        return None
+    # Cheapest approved candidate; the more confident one on ties
+    best = approved[np.lexsort((-probas[approved], costs[approved]))[0]]
+    candidate = dict(zip(features, candidates[best]))
+    return _result(application, candidate, probas[best], costs[best])
+
+
+# -------------------------
+# Entry point
+# -------------------------
+def find_counterfactual(application, model=None):
+    """
+    Smallest change to the editable fields that gets `application` (a dict)
+    approved by the model: {"changes": {feature: (old, new)}, "probability",
+    "distance"}. None when no model is available, the application is already
+    predicted as approved, or no change within the bounds flips the decision.
+    """
+    from compiled_model import CompiledLinearModel
+
+    if isinstance(model, CompiledLinearModel):
+        # Exported linear model: numpy only, no pandas/sklearn
+        _, preds = model.predict_proba_and_class(model.encode_one(application))
+        if preds[0] == 1:
+            return None
+        return _linear_counterfactual(model, application)
+
+    from analysis import load_scoring_model, compiled_model_for, predict_proba_and_class_batch
+
+    model = model if model is not None else load_scoring_model()
+    if model is None:
+        return None
+
+    _, preds = predict_proba_and_class_batch(model, [application])
+    if len(preds) == 0 or preds[0] == 1:
+        return None
+
+    compiled = compiled_model_for(model)
+    if compiled is not None:
+        return _linear_counterfactual(compiled, application)
+    return _grid_counterfactual(model, application)
+
+
+@lru_cache(maxsize=1024)
+def _counterfactual_cached(version, quantized):
+    from serving import load_exported_model
+
+    return find_counterfactual(dict(quantized), model=load_exported_model())
+
+
+def _rebase(suggestion, application, model):
+    """
+    A suggestion computed for the quantized inputs, applied to the actual
+    application (distance measured from its actual values); None unless the
+    model still approves the changed application.
+    """
+    changed = dict(application)
+    changed.update({feature: new for feature, (_, new) in suggestion["changes"].items()})
+    probas, preds = model.predict_proba_and_class(model.encode_one(changed))
+    if preds[0] != 1:
+        return None
+    changes = {
+        feature: (application.get(feature), new)
+        for feature, (_, new) in suggestion["changes"].items()
+        if _value(application, feature) != new
+    }
+    scales = dict(zip(model.numerical_cols, model.scales))
+    distance = sum(abs(new - _value(application, feature)) / scales[feature] for feature, (_, new) in changes.items())
+    return {"changes": changes, "probability": float(probas[0]), "distance": float(distance)}
+
+
+def counterfactual_for(application):
+    """
+    find_counterfactual() for the served model, memoized per model version on
+    the quantized model features (so identical or near-identical applications
+    share an entry; submission metadata is ignored). The cached suggestion is
+    checked against the actual inputs and recomputed exactly when it no
+    longer gets them approved.
+
+    Uses the exported linear model (serving.py) so the applicant page never
+    loads pandas or unpickles the sklearn pipeline; None when the served
+    version has no linear_model.json.
+    """
+    from serving import load_exported_model, model_version, quantize_application
+
+    model = load_exported_model()
+    if model is None:
+        return None
+    _, preds = model.predict_proba_and_class(model.encode_one(application))
+    if preds[0] == 1:
+        return None  # the quantized inputs may fall on the other side
+    features = {
+        col: application[col]
+        for col in model.numerical_cols + model.categorical_cols
+        if application.get(col) is not None
+    }
+    suggestion = _counterfactual_cached(model_version(), quantize_application(features))
+    rebased = _rebase(suggestion, application, model) if suggestion is not None else None
+    return rebased if rebased is not None else find_counterfactual(application, model=model)
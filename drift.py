@@ -0,0 +1,303 @@
+"""
+Data-drift and score-distribution monitoring.
+
+At training time build_reference() bins every model feature and the model
+score on the training data: numerical features into (up to) 10 quantile bins,
+categorical features into their known categories plus an "other" bin. The
+bin edges and proportions are saved with the model version as
+drift_reference.json.
+
+As applications are scored for the first time, record() adds them to
+per-bin counters in the drift_counts table, one row per (model version,
+time bucket, feature, bin). The counters are bounded by bins × buckets per
+feature no matter how many applications arrive; buckets older than
+DRIFT_RETENTION_DAYS are pruned. A sliding window ("last 24 hours") is the
+sum of its buckets.
+
+drift_report() compares a window with the reference per feature:
+- PSI, the population stability index: < 0.1 stable, 0.1–0.25 moderate,
+  > 0.25 significant shift
+- KS, the largest gap between the binned cumulative distributions
+  (numerical features and the score)
+"""
+
+import argparse
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select, update, insert, delete, func, bindparam
+from sqlalchemy.exc import IntegrityError
+
+from models import SessionLocal, DriftCount, FEATURE_COLUMNS
+
+REFERENCE_FORMAT = "fairfin-drift/1"
+# Pseudo-feature name of the model's approval probability
+SCORE_FEATURE = "score"
+DEFAULT_BINS = 10
+
+BUCKET_MINUTES = int(os.getenv("DRIFT_BUCKET_MINUTES", 60))
+RETENTION_DAYS = int(os.getenv("DRIFT_RETENTION_DAYS", 30))
+
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+# Floor for empty bins, so PSI stays finite
+_EPSILON = 1e-4
+
+
+# -------------------------
+# Reference snapshot
+# -------------------------
+def _numerical_reference(values, n_bins):
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {"kind": "numerical", "edges": [], "proportions": [1.0]}
+    # Discrete features (tenure, existing loans) collapse to fewer unique edges
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+    counts = np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+    return {"kind": "numerical", "edges": edges.tolist(), "proportions": (counts / len(values)).tolist()}
+
+
+def _categorical_reference(values):
+    counts = Counter(str(value) for value in values if value is not None)
+    total = sum(counts.values()) or 1
+    categories = sorted(counts)
+    return {
+        "kind": "categorical",
+        "categories": categories,
+        "proportions": [counts[c] / total for c in categories] + [0.0],  # last bin: unseen categories
+    }
+
+
+def build_reference(frame, scores, numerical_cols, categorical_cols, n_bins=DEFAULT_BINS):
+    """Reference histograms of the training features (a DataFrame) and model scores."""
+    features = {col: _numerical_reference(frame[col], n_bins) for col in numerical_cols}
+    features.update({col: _categorical_reference(frame[col]) for col in categorical_cols})
+    features[SCORE_FEATURE] = _numerical_reference(scores, n_bins)
+    return {
+        "format": REFERENCE_FORMAT,
+        "rows": int(len(frame)),
+        "created_at": datetime.utcnow().isoformat(),
+        "features": features,
+    }
+
+
+def save_reference(reference, path):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(reference, fh, indent=2)
+
+
+def bin_indexes(spec, values):
+    """Bin index per value under a reference feature spec; missing values are dropped."""
+    if spec["kind"] == "numerical":
+        values = np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+        values = values[~np.isnan(values)]
+        return np.searchsorted(np.asarray(spec["edges"], dtype=float), values, side="right")
+    index = {category: i for i, category in enumerate(spec["categories"])}
+    other = len(spec["categories"])
+    return np.array([index.get(str(v), other) for v in values if v is not None], dtype=np.intp)
+
+
+def bin_labels(spec):
+    if spec["kind"] == "categorical":
+        return spec["categories"] + ["(other)"]
+    edges = [f"{edge:g}" for edge in spec["edges"]]
+    if not edges:
+        return ["all"]
+    return [f"< {edges[0]}"] + [f"{lo} – {hi}" for lo, hi in zip(edges, edges[1:])] + [f"≥ {edges[-1]}"]
+
+
+# -------------------------
+# Streaming counters
+# -------------------------
+def bucket_start(moment):
+    """Start of the BUCKET_MINUTES time bucket containing `moment`."""
+    minutes = (moment.hour * 60 + moment.minute) // BUCKET_MINUTES * BUCKET_MINUTES
+    return moment.replace(hour=minutes // 60, minute=minutes % 60, second=0, microsecond=0)
+
+
+_last_pruned_bucket = None
+
+
+def record(session, rows, scores, model_version):
+    """
+    Counts newly scored applications (rows carrying the typed feature
+    columns, with their scores) into the current bucket, in the caller's
+    transaction. Skipped when the served version has no drift reference or
+    the scores came from another version.
+    """
+    from analysis import load_drift_reference, model_version as served_version
+
+    if not rows:
+        return
+    reference = load_drift_reference()
+    if reference is None or model_version != served_version():
+        return
+
+    counts = Counter()
+    for feature, spec in reference["features"].items():
+        if feature == SCORE_FEATURE:
+            values = scores
+        elif feature in FEATURE_COLUMNS:
+            values = [getattr(row, FEATURE_COLUMNS[feature]) for row in rows]
+        else:
+            continue
+        bins, bin_counts = np.unique(bin_indexes(spec, values), return_counts=True)
+        for b, count in zip(bins, bin_counts):
+            counts[(feature, int(b))] += int(count)
+
+    bucket = bucket_start(datetime.utcnow())
+    _add_counts(session, model_version, bucket, counts)
+    _prune(session, bucket)
+
+
+def _add_counts(session, model_version, bucket, counts):
+    table = DriftCount.__table__
+    stmt = (
+        update(table)
+        .where(
+            table.c.model_version == bindparam("b_model_version"),
+            table.c.window_start == bindparam("b_window_start"),
+            table.c.feature == bindparam("b_feature"),
+            table.c.bin == bindparam("b_bin"),
+        )
+        .values(count=table.c.count + bindparam("b_count"))
+    )
+    keys = sorted(counts)
+    params = [
+        {"b_model_version": model_version, "b_window_start": bucket, "b_feature": feature, "b_bin": b,
+         "b_count": counts[(feature, b)]}
+        for feature, b in keys
+    ]
+    conn = session.connection()
+    if not params or conn.execute(stmt, params).rowcount == len(params):
+        return
+
+    # First applications of this bucket: insert its rows (see fairness._apply_deltas)
+    existing = set(conn.execute(
+        select(table.c.feature, table.c.bin)
+        .where(table.c.model_version == model_version, table.c.window_start == bucket)
+    ).tuples())
+    for key, row_params in zip(keys, params):
+        if key in existing:
+            continue
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(table).values(
+                    model_version=model_version, window_start=bucket,
+                    feature=key[0], bin=key[1], count=counts[key],
+                ))
+        except IntegrityError:
+            conn.execute(stmt, [row_params])
+
+
+def _prune(session, bucket):
+    """Drops buckets past the retention period, once per new bucket in this process."""
+    global _last_pruned_bucket
+    if _last_pruned_bucket == bucket:
+        return
+    session.execute(delete(DriftCount).where(DriftCount.window_start < bucket - timedelta(days=RETENTION_DAYS)))
+    _last_pruned_bucket = bucket
+
+
+# -------------------------
+# Drift metrics
+# -------------------------
+def psi(expected, actual):
+    expected = np.clip(np.asarray(expected, dtype=float), _EPSILON, None)
+    actual = np.clip(np.asarray(actual, dtype=float), _EPSILON, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks_statistic(expected, actual):
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual))))
+
+
+def psi_status(value):
+    if value is None:
+        return "no data"
+    if value > PSI_SIGNIFICANT:
+        return "significant"
+    if value > PSI_MODERATE:
+        return "moderate"
+    return "stable"
+
+
+def drift_report(session, hours=24):
+    """
+    Drift of the last `hours` of scored applications against the served model's
+    reference: {"model_version", "hours", "since", "features": [...]} with one
+    entry per feature (n, psi, ks, status, bin labels, reference and live
+    proportions), or None when the served version has no drift reference.
+    """
+    from analysis import load_drift_reference, model_version
+
+    reference = load_drift_reference()
+    if reference is None:
+        return None
+    version = model_version()
+    since = bucket_start(datetime.utcnow() - timedelta(hours=hours))
+
+    observed = {}
+    for feature, b, count in (
+        session.query(DriftCount.feature, DriftCount.bin, func.sum(DriftCount.count))
+        .filter(DriftCount.model_version == version, DriftCount.window_start >= since)
+        .group_by(DriftCount.feature, DriftCount.bin)
+    ):
+        observed.setdefault(feature, {})[b] = int(count)
+
+    features = []
+    for feature, spec in reference["features"].items():
+        expected = np.asarray(spec["proportions"], dtype=float)
+        counts = np.zeros(len(expected))
+        for b, count in observed.get(feature, {}).items():
+            if 0 <= b < len(counts):
+                counts[b] = count
+        n = int(counts.sum())
+        actual = counts / n if n else None
+        value = psi(expected, actual) if n else None
+        features.append({
+            "feature": feature,
+            "kind": spec["kind"],
+            "n": n,
+            "psi": value,
+            "ks": ks_statistic(expected, actual) if n and spec["kind"] == "numerical" else None,
+            "status": psi_status(value),
+            "bins": bin_labels(spec),
+            "reference": expected.tolist(),
+            "live": actual.tolist() if n else None,
+        })
+
+    return {"model_version": version, "hours": hours, "since": since.isoformat(), "features": features}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FairFin drift monitor.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report_cmd = sub.add_parser("report", help="print drift of a recent window as JSON")
+    report_cmd.add_argument("--hours", type=float, default=24)
+    report_cmd.add_argument("--summary", action="store_true", help="omit the per-bin proportions")
+    args = parser.parse_args()
+
+    from models import init_db
+    init_db()
+
+    session = SessionLocal()
+    try:
+        report = drift_report(session, hours=args.hours)
+    finally:
+        session.close()
+    if report is None:
+        raise SystemExit("❌ The served model version has no drift reference; retrain to create one.")
+    if args.summary:
+        for entry in report["features"]:
+            for key in ("bins", "reference", "live"):
+                entry.pop(key)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Fairness metrics per protected-attribute group.
+
+Every loan adds a small vector of counters to its Gender, Region and
+Employment_Type groups (decided, approved, scored, score sum, predicted
+approvals, approved-with-score, approved-and-predicted-approved). The sums are
+kept in the fairness_aggregates table and moved by the difference between a
+loan's old and new counters whenever it is scored (scoring.py) or decided
+(services.record_decision), in the same transaction as that change, with
+UPDATE col = col + delta. The admin view reads the handful of aggregate rows
+instead of scanning loan_applications.
+
+Metrics derived from the counters, per group:
+- approval rate: approved / decided
+- mean score: score sum / scored
+- disparate impact: approval rate / highest approval rate within the attribute
+  (below 0.8 fails the four-fifths rule)
+- equal-opportunity gap: highest true positive rate within the attribute minus
+  the group's, where the true positive rate is the share of approved loans the
+  model also predicted as approved
+
+rebuild_aggregates() recomputes everything with one GROUP BY per attribute;
+it runs automatically the first time on a database that has loans but no
+aggregates, and on demand (admin view, `python fairness.py rebuild`).
+"""
+
+import argparse
+from datetime import datetime
+
+from sqlalchemy import select, update, insert, delete, func, case, bindparam
+from sqlalchemy.exc import IntegrityError
+
+from models import engine, SessionLocal, LoanApplication, LoanStatus, FairnessAggregate
+
+# Protected attribute (feature name) → typed LoanApplication column
+FAIRNESS_ATTRIBUTES = {
+    "Gender": "gender",
+    "Region": "region",
+    "Employment_Type": "employment_type",
+}
+
+COUNTERS = ("decided", "approved", "scored", "score_sum", "predicted_approved", "positives", "true_positives")
+
+UNKNOWN_GROUP = "Unknown"
+DISPARATE_IMPACT_THRESHOLD = 0.8
+
+
+# -------------------------
+# Per-loan counters
+# -------------------------
+def _status(value):
+    return LoanStatus(getattr(value, "value", value)) if value is not None else None
+
+
+def loan_counters(status, score, predicted_class):
+    """The counters one loan contributes to each of its groups."""
+    status = _status(status)
+    decided = status in (LoanStatus.approved, LoanStatus.denied)
+    approved = status == LoanStatus.approved
+    scored = score is not None
+    predicted_approved = scored and predicted_class == 1
+    return {
+        "decided": int(decided),
+        "approved": int(approved),
+        "scored": int(scored),
+        "score_sum": float(score) if scored else 0.0,
+        "predicted_approved": int(predicted_approved),
+        "positives": int(approved and scored),
+        "true_positives": int(approved and predicted_approved),
+    }
+
+
+def groups_of(row):
+    """{attribute: group} for a loan or a row carrying the typed group columns."""
+    return {
+        attribute: getattr(row, attr) or UNKNOWN_GROUP
+        for attribute, attr in FAIRNESS_ATTRIBUTES.items()
+    }
+
+
+# -------------------------
+# Incremental updates
+# -------------------------
+def record_changes(session, changes):
+    """
+    Applies loan changes to the aggregates in the caller's transaction.
+    `changes` is an iterable of (row, old_counters, new_counters), where row
+    carries the group columns (see groups_of) and the counters come from
+    loan_counters() before and after the change.
+    """
+    deltas = {}
+    for row, old, new in changes:
+        diff = {name: new[name] - old[name] for name in COUNTERS}
+        if not any(diff.values()):
+            continue
+        for attribute, group in groups_of(row).items():
+            total = deltas.setdefault((attribute, group), dict.fromkeys(COUNTERS, 0))
+            for name, value in diff.items():
+                total[name] += value
+    if deltas:
+        _apply_deltas(session, deltas)
+
+
+def _apply_deltas(session, deltas):
+    now = datetime.utcnow()
+    table = FairnessAggregate.__table__
+    stmt = (
+        update(table)
+        .where(table.c.attribute == bindparam("b_attribute"), table.c.group_value == bindparam("b_group"))
+        .values(updated_at=bindparam("b_updated_at"),
+                **{name: table.c[name] + bindparam(f"b_{name}") for name in COUNTERS})
+    )
+
+    def params(key):
+        attribute, group = key
+        return {"b_attribute": attribute, "b_group": group, "b_updated_at": now,
+                **{f"b_{name}": value for name, value in deltas[key].items()}}
+
+    conn = session.connection()
+    keys = sorted(deltas)  # a fixed order keeps concurrent writers from deadlocking
+    if conn.execute(stmt, [params(key) for key in keys]).rowcount == len(keys):
+        return
+
+    # First loan of a new group: insert its row (a concurrent insert of the
+    # same group loses on the unique index and falls back to the UPDATE)
+    existing = set(conn.execute(
+        select(table.c.attribute, table.c.group_value)
+        .where(table.c.attribute.in_({attribute for attribute, _ in keys}))
+    ).tuples())
+    for key in keys:
+        if key in existing:
+            continue
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(table).values(
+                    attribute=key[0], group_value=key[1], updated_at=now, **deltas[key]
+                ))
+        except IntegrityError:
+            conn.execute(stmt, [params(key)])
+
+
+# -------------------------
+# Full recompute
+# -------------------------
+def _group_totals(conn, attribute):
+    column = getattr(LoanApplication, FAIRNESS_ATTRIBUTES[attribute])
+    decided = LoanApplication.status.in_([LoanStatus.approved, LoanStatus.denied])
+    approved = LoanApplication.status == LoanStatus.approved
+    scored = LoanApplication.score.isnot(None)
+    predicted = scored & (LoanApplication.predicted_class == 1)
+
+    def count(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+    group = func.coalesce(column, UNKNOWN_GROUP)
+    stmt = select(
+        group.label("group_value"),
+        count(decided).label("decided"),
+        count(approved).label("approved"),
+        count(scored).label("scored"),
+        func.coalesce(func.sum(LoanApplication.score), 0.0).label("score_sum"),
+        count(predicted).label("predicted_approved"),
+        count(approved & scored).label("positives"),
+        count(approved & predicted).label("true_positives"),
+    ).group_by(group)
+    return conn.execute(stmt).mappings().all()
+
+
+def rebuild_aggregates():
+    """Recomputes every aggregate from loan_applications. Returns the number of groups."""
+    now = datetime.utcnow()
+    rows = []
+    with engine.begin() as conn:
+        for attribute in FAIRNESS_ATTRIBUTES:
+            rows += [{"attribute": attribute, **totals, "updated_at": now} for totals in _group_totals(conn, attribute)]
+        conn.execute(delete(FairnessAggregate))
+        if rows:
+            conn.execute(insert(FairnessAggregate), rows)
+    return len(rows)
+
+
+def ensure_aggregates():
+    """Builds the aggregates once for a database that has loans but none yet."""
+    with engine.connect() as conn:
+        if conn.execute(select(FairnessAggregate.id).limit(1)).first() is not None:
+            return
+        if conn.execute(select(LoanApplication.id).limit(1)).first() is None:
+            return
+    print(f"Building fairness aggregates: {rebuild_aggregates()} groups.")
+
+
+# -------------------------
+# Metrics
+# -------------------------
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+def fairness_report(session):
+    """
+    {attribute: [group metrics, ...]} computed from the stored aggregates.
+    Each group dict has the raw counts plus approval_rate, mean_score,
+    predicted_approval_rate, true_positive_rate, disparate_impact and
+    equal_opportunity_gap (None where a group has no data yet).
+    """
+    report = {}
+    for agg in session.query(FairnessAggregate).order_by(FairnessAggregate.attribute, FairnessAggregate.group_value):
+        report.setdefault(agg.attribute, []).append({
+            "group": agg.group_value,
+            "decided": agg.decided,
+            "approved": agg.approved,
+            "scored": agg.scored,
+            "approval_rate": _ratio(agg.approved, agg.decided),
+            "mean_score": _ratio(agg.score_sum, agg.scored),
+            "predicted_approval_rate": _ratio(agg.predicted_approved, agg.scored),
+            "true_positive_rate": _ratio(agg.true_positives, agg.positives),
+        })
+
+    for groups in report.values():
+        best_rate = max((g["approval_rate"] for g in groups if g["approval_rate"] is not None), default=None)
+        best_tpr = max((g["true_positive_rate"] for g in groups if g["true_positive_rate"] is not None), default=None)
+        for g in groups:
+            g["disparate_impact"] = (
+                _ratio(g["approval_rate"], best_rate) if g["approval_rate"] is not None else None
+            )
+            g["equal_opportunity_gap"] = (
+                best_tpr - g["true_positive_rate"] if g["true_positive_rate"] is not None else None
+            )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FairFin fairness aggregates.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="recompute the aggregates from loan_applications")
+    sub.add_parser("report", help="print the metrics per group")
+    args = parser.parse_args()
+
+    from models import init_db
+    init_db()
+
+    if args.command == "rebuild":
+        print(f"Rebuilt {rebuild_aggregates()} fairness groups.")
+        return
+
+    session = SessionLocal()
+    try:
+        for attribute, groups in fairness_report(session).items():
+            print(attribute)
+            for g in groups:
+                print("  " + ", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                                      for key, value in g.items()))
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Versioned model artifact store.
+
+Each trained model is published into its own immutable directory with a
+manifest of checksums, and a one-line CURRENT file names the version in use:
+
+    models/
+      CURRENT                   # "20261016-231500-3f2a9c"
+      20261016-231500-3f2a9c/
+        manifest.json           # version, created_at, {file: {sha256, size}}
+        model.joblib, explainer.joblib, ...
+
+Publishing writes the whole version first and only then replaces CURRENT
+with os.replace(), so readers never see a half-written or mixed set of
+artifacts. A running process notices the new pointer, verifies and
+prewarms the new version on a background thread while it keeps serving the
+old one, then switches over: no restart and no cold-load spike on the
+request path. Without a CURRENT file the flat legacy layout (artifacts
+directly in models/) is served.
+"""
+
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from artifacts import file_sha256
+
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+
+# -------------------------
+# Publishing
+# -------------------------
+def write_manifest(version_dir, version, metadata=None):
+    """Checksums every file in `version_dir` into its manifest.json."""
+    files = {}
+    for name in sorted(os.listdir(version_dir)):
+        path = os.path.join(version_dir, name)
+        if name != MANIFEST_FILE and os.path.isfile(path):
+            files[name] = {"sha256": file_sha256(path), "size": os.path.getsize(path)}
+
+    manifest = {
+        "version": version,
+        "created_at": datetime.utcnow().isoformat(),
+        "files": files,
+        **(metadata or {}),
+    }
+    with open(os.path.join(version_dir, MANIFEST_FILE), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+
+def read_manifest(version_dir):
+    with open(os.path.join(version_dir, MANIFEST_FILE), encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def verify_version(version_dir):
+    """
+    Raises ValueError unless every file listed in the manifest is present
+    with the recorded checksum.
+    """
+    manifest = read_manifest(version_dir)
+    for name, expected in manifest["files"].items():
+        path = os.path.join(version_dir, name)
+        if not os.path.exists(path):
+            raise ValueError(f"{name} is missing from version {manifest['version']}")
+        if file_sha256(path) != expected["sha256"]:
+            raise ValueError(f"{name} does not match the checksum in version {manifest['version']}")
+    return manifest
+
+
+def new_staging_dir(root):
+    """Scratch directory (inside `root`, so publishing is a same-filesystem rename)."""
+    path = os.path.join(root, f".staging-{uuid.uuid4().hex[:8]}")
+    os.makedirs(path)
+    return path
+
+
+def set_current(root, version):
+    """Atomically points CURRENT at `version`."""
+    tmp_path = os.path.join(root, f".{CURRENT_FILE}.{uuid.uuid4().hex[:8]}")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        fh.write(version + "\n")
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def publish(root, staging_dir, version=None, metadata=None, make_current=True):
+    """
+    Turns a fully written staging directory into models/<version>/ (manifest
+    included) and, by default, makes it the current version. Returns the version.
+    """
+    if version is None:
+        version = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+    write_manifest(staging_dir, version, metadata)
+    version_dir = os.path.join(root, version)
+    if os.path.exists(version_dir):
+        raise FileExistsError(f"Model version {version} already exists")
+    os.rename(staging_dir, version_dir)
+
+    if make_current:
+        set_current(root, version)
+    return version
+
+
+def list_versions(root):
+    """Published versions (directories with a manifest), oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if not name.startswith(".") and os.path.exists(os.path.join(root, name, MANIFEST_FILE))
+    )
+
+
+def read_current(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# -------------------------
+# Serving
+# -------------------------
+class ModelStore:
+    """
+    Tracks which version directory this process serves and hot-swaps to the
+    version named by CURRENT once it has been verified and prewarmed.
+
+    `warm(directory)` loads a version's artifacts into the process caches;
+    `retire(directory)` drops the caches of a version that is no longer served.
+    """
+
+    def __init__(self, root, warm=None, retire=None):
+        self.root = root
+        self._warm = warm
+        self._retire = retire
+        self._lock = threading.Lock()
+        self._pointer_signature = None
+        self._pointer = None
+        self._active = None       # version being served (None = legacy flat layout)
+        self._activated = False
+        self._swapping = None     # version being prewarmed in the background
+        # (version, files signature) that failed verification/prewarm; retried
+        # once its files change or CURRENT is rewritten
+        self._rejected = None
+
+    def _read_pointer(self):
+        path = os.path.join(self.root, CURRENT_FILE)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if signature != self._pointer_signature:
+            self._pointer = read_current(self.root)
+            self._pointer_signature = signature
+            self._rejected = None  # re-pointed (or rewritten): give it another try
+        return self._pointer
+
+    def _files_signature(self, version):
+        """(name, mtime, size) of every file in a version directory."""
+        directory = self.version_dir(version)
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return None
+        signature = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _is_rejected(self, version):
+        return self._rejected is not None and self._rejected == (version, self._files_signature(version))
+
+    def _reject(self, version):
+        self._rejected = (version, self._files_signature(version))
+
+    def version_dir(self, version):
+        return self.root if version is None else os.path.join(self.root, version)
+
+    def active_version(self):
+        """Version currently served (None for the legacy flat layout)."""
+        pointer = self._read_pointer()
+        if self._activated and pointer == self._active:
+            return self._active
+
+        with self._lock:
+            if not self._activated:
+                # First use in this process: nothing to keep serving meanwhile
+                self._activate(pointer, verify=pointer is not None)
+            elif pointer != self._active and pointer != self._swapping and not self._is_rejected(pointer):
+                self._swapping = pointer
+                threading.Thread(target=self._swap_to, args=(pointer,), name="model-prewarm", daemon=True).start()
+            return self._active
+
+    def active_dir(self):
+        return self.version_dir(self.active_version())
+
+    def _activate(self, version, verify):
+        try:
+            if verify:
+                verify_version(self.version_dir(version))
+        except Exception as e:
+            print(f"⚠ Model version {version} failed verification, keeping the current one:", e)
+            self._reject(version)
+            if not self._activated:
+                # Nothing served yet: fall back to the legacy layout
+                self._active, self._activated = None, True
+            return False
+        self._active, self._activated = version, True
+        return True
+
+    def _swap_to(self, version):
+        previous = self._active
+        try:
+            verify_version(self.version_dir(version))
+            if self._warm is not None:
+                self._warm(self.version_dir(version))
+        except Exception as e:
+            print(f"⚠ Could not switch to model version {version}:", e)
+            with self._lock:
+                self._reject(version)
+                self._swapping = None
+            return
+
+        with self._lock:
+            self._active = version
+            self._swapping = None
+        print(f"Switched to model version {version}")
+        if self._retire is not None and previous != version:
+            self._retire(self.version_dir(previous))
+
+    def manifest(self):
+        version = self.active_version()
+        return None if version is None else read_manifest(self.version_dir(version))
@@ -1,119 +1,360 @@
 # model_training.py
+"""
+Training entry point for the FairFin loan model.
+
+Reads training data from one of:
+- synthetic rows (the original generator, reproducible by seed),
+- decided LoanApplication rows in the database (approved → 1, denied → 0),
+- large CSV or Parquet files with the feature columns plus Loan_Approved,
+streamed in chunks into compact dtypes. Hyperparameters are picked by
+cross-validated grid search run across all cores (joblib's process pool),
+on a stratified sample when the data is large, then the best model is
+refit on the full training split. Wall time of every stage is printed and
+stored in the published version's manifest.
+
+    python model_training.py                                    # synthetic, as before
+    python model_training.py --source db --database-url sqlite:///fairfin.db
+    python model_training.py --source parquet --path history.parquet --n-jobs -1
+"""
+
+import argparse
 import os
+import time
+from contextlib import contextmanager
+
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 import joblib
-import shap
 
-MODEL_DIR = "models"
-os.makedirs(MODEL_DIR, exist_ok=True)
-
-# -----------------------------
-# Synthetic Dataset Generation
-# -----------------------------
-np.random.seed(42)
-n = 1000
-
-data = pd.DataFrame({
-    'Gender': np.random.choice(['Male', 'Female'], n),
-    'Region': np.random.choice(['Urban', 'Rural', 'Semi-Urban'], n),
-    'Employment_Type': np.random.choice(['Salaried', 'Self-Employed', 'Freelancer'], n),
-    'Annual_Income': np.random.randint(20000, 150001, n),
-    'Credit_Score': np.random.randint(300, 851, n),
-    'Loan_Amount': np.random.randint(50000, 200001, n),
-    'Loan_Tenure_Months': np.random.choice([12, 24, 36, 48, 60], n),
-    'Existing_Loans': np.random.randint(0, 4, n),
-    'Monthly_Expenses': np.random.randint(5000, 30001, n)
-})
+from compiled_model import compile_pipeline
+from drift import build_reference, save_reference
+from model_store import new_staging_dir, publish
 
-# -----------------------------
-# Derived Label Logic
-# -----------------------------
-income_norm = data['Annual_Income'] / data['Annual_Income'].max()
-loan_amount_norm = data['Loan_Amount'] / data['Loan_Amount'].max()
-credit_score_norm = data['Credit_Score'] / 850
-monthly_expenses_norm = data['Monthly_Expenses'] / data['Monthly_Expenses'].max()
-existing_loans_norm = data['Existing_Loans'] / 3
-loan_tenure_norm = data['Loan_Tenure_Months'] / 60
-
-approval_probability = (
-    0.4 * income_norm +
-    0.3 * credit_score_norm -
-    0.2 * loan_amount_norm -
-    0.1 * monthly_expenses_norm -
-    0.05 * existing_loans_norm +
-    0.05 * loan_tenure_norm
-).clip(0, 1)
-
-data['Loan_Approved'] = (approval_probability > 0.4).astype(int)
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
 
 # -----------------------------
 # Feature Config
 # -----------------------------
 categorical_cols = ['Gender', 'Region', 'Employment_Type']
 numerical_cols = ['Annual_Income', 'Credit_Score', 'Loan_Amount', 'Loan_Tenure_Months', 'Existing_Loans', 'Monthly_Expenses']
+TARGET = 'Loan_Approved'
 
-X = data.drop(columns=['Loan_Approved'])
-y = data['Loan_Approved']
+DEFAULT_CHUNK_SIZE = 200_000
+DEFAULT_C_GRID = [0.01, 0.1, 1.0, 10.0]
 
-preprocessor = ColumnTransformer(transformers=[
-    ('num', StandardScaler(), numerical_cols),
-    ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), categorical_cols)
-])
-
-pipeline = Pipeline(steps=[
-    ('preprocessor', preprocessor),
-    ('classifier', LogisticRegression(max_iter=500))
-])
 
 # -----------------------------
-# Train/Test Split and Model Fit
+# Stage timings
 # -----------------------------
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-pipeline.fit(X_train, y_train)
+class StageTimer:
+    """Wall-clock seconds per named training stage."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - started, 3)
+            print(f"[{name}] {self.timings[name]:.2f}s")
+
 
 # -----------------------------
-# Feature Name Extraction
+# Synthetic Dataset Generation
 # -----------------------------
-try:
-    cat_enc = pipeline.named_steps['preprocessor'].named_transformers_['cat']
-    cat_names = list(cat_enc.get_feature_names_out(categorical_cols))
-except Exception:
-    cat_names = []
-    for c in categorical_cols:
-        cat_names += [f"{c}_{value}" for value in sorted(data[c].unique())]
+def generate_synthetic_data(n=1000, seed=42):
+    """Synthetic applications with the derived approval label (reproducible by seed)."""
+    rng = np.random.RandomState(seed)
+
+    data = pd.DataFrame({
+        'Gender': rng.choice(['Male', 'Female'], n),
+        'Region': rng.choice(['Urban', 'Rural', 'Semi-Urban'], n),
+        'Employment_Type': rng.choice(['Salaried', 'Self-Employed', 'Freelancer'], n),
+        'Annual_Income': rng.randint(20000, 150001, n),
+        'Credit_Score': rng.randint(300, 851, n),
+        'Loan_Amount': rng.randint(50000, 200001, n),
+        'Loan_Tenure_Months': rng.choice([12, 24, 36, 48, 60], n),
+        'Existing_Loans': rng.randint(0, 4, n),
+        'Monthly_Expenses': rng.randint(5000, 30001, n)
+    })
+
+    # -----------------------------
+    # Derived Label Logic
+    # -----------------------------
+    income_norm = data['Annual_Income'] / data['Annual_Income'].max()
+    loan_amount_norm = data['Loan_Amount'] / data['Loan_Amount'].max()
+    credit_score_norm = data['Credit_Score'] / 850
+    monthly_expenses_norm = data['Monthly_Expenses'] / data['Monthly_Expenses'].max()
+    existing_loans_norm = data['Existing_Loans'] / 3
+    loan_tenure_norm = data['Loan_Tenure_Months'] / 60
+
+    approval_probability = (
+        0.4 * income_norm +
+        0.3 * credit_score_norm -
+        0.2 * loan_amount_norm -
+        0.1 * monthly_expenses_norm -
+        0.05 * existing_loans_norm +
+        0.05 * loan_tenure_norm
+    ).clip(0, 1)
+
+    data[TARGET] = (approval_probability > 0.4).astype(int)
+    return data
 
-feature_names = numerical_cols + cat_names
 
 # -----------------------------
-# SHAP Explainer (Optional)
+# Chunked ingestion
 # -----------------------------
-try:
-    X_train_trans = pipeline.named_steps['preprocessor'].transform(X_train)
-    explainer = shap.LinearExplainer(pipeline.named_steps['classifier'], X_train_trans)
-    joblib.dump(explainer, os.path.join(MODEL_DIR, "explainer.joblib"))
-    print("SHAP explainer saved.")
-except Exception as e:
-    print("⚠ Could not build SHAP explainer:", e)
-    explainer = None
+def _compact(chunk):
+    """float32 numerics, category dtype for strings: several times smaller than the raw frame."""
+    chunk = chunk[numerical_cols + categorical_cols + [TARGET]].dropna()
+    out = {col: chunk[col].astype(np.float32) for col in numerical_cols}
+    out.update({col: chunk[col].astype(str).astype("category") for col in categorical_cols})
+    out[TARGET] = chunk[TARGET].astype(np.int8)
+    return pd.DataFrame(out)
+
+
+def iter_db_chunks(database_url, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Decided applications (approved → 1, denied → 0) from the typed feature columns, streamed."""
+    from sqlalchemy import select
+    from models import make_engine, LoanApplication, LoanStatus, FEATURE_COLUMNS
+
+    columns = [getattr(LoanApplication, attr).label(feature) for feature, attr in FEATURE_COLUMNS.items()]
+    stmt = (
+        select(*columns, (LoanApplication.status == LoanStatus.approved).label(TARGET))
+        .where(LoanApplication.status.in_([LoanStatus.approved, LoanStatus.denied]))
+        .order_by(LoanApplication.id)
+    )
+    engine = make_engine(database_url)
+    try:
+        with engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True, yield_per=chunk_size)
+            yield from pd.read_sql(stmt, conn, chunksize=chunk_size)
+    finally:
+        engine.dispose()
+
+
+def iter_csv_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    yield from pd.read_csv(path, usecols=numerical_cols + categorical_cols + [TARGET], chunksize=chunk_size)
+
+
+def iter_parquet_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise SystemExit("❌ Reading Parquet needs pyarrow (pip install pyarrow).") from e
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=numerical_cols + categorical_cols + [TARGET]):
+        yield batch.to_pandas()
+
+
+def load_training_data(source, path=None, database_url=None, rows=1000, seed=42, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Training frame (features + Loan_Approved) from the chosen source."""
+    if source == "synthetic":
+        return _compact(generate_synthetic_data(rows, seed))
+
+    if source == "db":
+        chunks = iter_db_chunks(database_url or os.environ.get("DATABASE_URL", "sqlite:///fairfin.db"), chunk_size)
+    elif source == "csv":
+        chunks = iter_csv_chunks(path, chunk_size)
+    elif source == "parquet":
+        chunks = iter_parquet_chunks(path, chunk_size)
+    else:
+        raise ValueError(f"Unknown data source: {source}")
+
+    parts = [_compact(chunk) for chunk in chunks]
+    if not parts:
+        raise SystemExit(f"❌ No training rows found in {source} source.")
+
+    data = pd.concat(parts, ignore_index=True)
+    # Chunks can see different category sets; concat then falls back to object
+    for col in categorical_cols:
+        data[col] = data[col].astype(str).astype("category")
+    return data
+
 
 # -----------------------------
-# Save Artifacts
+# Model
 # -----------------------------
-joblib.dump(pipeline, os.path.join(MODEL_DIR, "model.joblib"))
-joblib.dump(feature_names, os.path.join(MODEL_DIR, "feature_names.joblib"))
-joblib.dump(categorical_cols, os.path.join(MODEL_DIR, "categorical_cols.joblib"))
-joblib.dump(numerical_cols, os.path.join(MODEL_DIR, "numerical_cols.joblib"))
+def build_pipeline(C=1.0, seed=42):
+    preprocessor = ColumnTransformer(transformers=[
+        ('num', StandardScaler(), numerical_cols),
+        ('cat', OneHotEncoder(handle_unknown='ignore', sparse_output=False), categorical_cols)
+    ])
+
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('classifier', LogisticRegression(C=C, max_iter=500, random_state=seed))
+    ])
+
+
+def _stratified_sample(X, y, max_rows, seed):
+    if max_rows is None or len(X) <= max_rows:
+        return X, y
+    X_sample, _, y_sample, _ = train_test_split(X, y, train_size=max_rows, stratify=y, random_state=seed)
+    return X_sample, y_sample
+
+
+def search_hyperparameters(X, y, c_grid=DEFAULT_C_GRID, cv=5, n_jobs=-1, seed=42):
+    """Cross-validated grid search; each (candidate, fold) fit runs in a worker process."""
+    search = GridSearchCV(
+        build_pipeline(seed=seed),
+        {"classifier__C": list(c_grid)},
+        cv=StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed),
+        scoring="roc_auc",
+        n_jobs=n_jobs,
+        refit=False,
+    )
+    search.fit(X, y)
+    return search.best_params_, float(search.best_score_)
+
+
+def feature_names_for(pipeline, data):
+    try:
+        cat_enc = pipeline.named_steps['preprocessor'].named_transformers_['cat']
+        cat_names = list(cat_enc.get_feature_names_out(categorical_cols))
+    except Exception:
+        cat_names = []
+        for c in categorical_cols:
+            cat_names += [f"{c}_{value}" for value in sorted(data[c].unique())]
+    return numerical_cols + cat_names
+
+
+def build_explainer(pipeline, X_background):
+    """SHAP LinearExplainer over a background sample (None if shap is unavailable)."""
+    try:
+        import shap
+
+        X_background_trans = pipeline.named_steps['preprocessor'].transform(X_background)
+        return shap.LinearExplainer(pipeline.named_steps['classifier'], X_background_trans)
+    except Exception as e:
+        print("⚠ Could not build SHAP explainer:", e)
+        return None
+
 
 # -----------------------------
-# Performance Output
+# Save Artifacts
 # -----------------------------
-accuracy = pipeline.score(X_test, y_test)
-print(f"\nModel Training Complete.")
-print(f"Test Accuracy: {accuracy:.3f}")
-print("Artifacts saved to ./models/")
+def save_artifacts(staging_dir, pipeline, feature_names, explainer, X_train, X_test):
+    if explainer is not None:
+        # Background means let analysis.py compute linear contributions without shap
+        # (use the explainer's own mean, since shap may subsample the background)
+        joblib.dump(np.asarray(explainer.mean).ravel(), os.path.join(staging_dir, "background_mean.joblib"))
+        joblib.dump(explainer, os.path.join(staging_dir, "explainer.joblib"))
+
+    joblib.dump(pipeline, os.path.join(staging_dir, "model.joblib"))
+    joblib.dump(feature_names, os.path.join(staging_dir, "feature_names.joblib"))
+    joblib.dump(categorical_cols, os.path.join(staging_dir, "categorical_cols.joblib"))
+    joblib.dump(numerical_cols, os.path.join(staging_dir, "numerical_cols.joblib"))
+
+    # Pickle-free export (JSON manifest + .npy arrays) that the app memory-maps
+    # instead of unpickling model/explainer; verified on (a sample of) the test set
+    compiled = compile_pipeline(
+        pipeline,
+        records=X_test.head(10_000).to_dict("records"),
+        feature_names=feature_names,
+        background_mean=np.asarray(explainer.mean).ravel() if explainer is not None else None,
+    )
+    if compiled is not None:
+        compiled.save(os.path.join(staging_dir, "linear_model.json"))
+
+    # Feature and score histograms of the training data, the baseline for drift.py
+    reference = build_reference(X_train, pipeline.predict_proba(X_train)[:, 1], numerical_cols, categorical_cols)
+    save_reference(reference, os.path.join(staging_dir, "drift_reference.json"))
+
+
+def train(args):
+    timer = StageTimer()
+
+    with timer.stage("load"):
+        data = load_training_data(
+            args.source, path=args.path, database_url=args.database_url,
+            rows=args.rows, seed=args.seed, chunk_size=args.chunk_size,
+        )
+    print(f"Loaded {len(data):,} rows ({data.memory_usage(deep=True).sum() / 1e6:.1f} MB) from {args.source}")
+    if data[TARGET].nunique() < 2:
+        raise SystemExit("❌ Training data needs both approved and denied applications.")
+
+    X = data.drop(columns=[TARGET])
+    y = data[TARGET]
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=args.seed, stratify=y
+    )
+
+    with timer.stage("search"):
+        X_search, y_search = _stratified_sample(X_train, y_train, args.search_rows, args.seed)
+        best_params, cv_score = search_hyperparameters(
+            X_search, y_search, c_grid=args.c_grid, cv=args.cv, n_jobs=args.n_jobs, seed=args.seed
+        )
+    print(f"Best params {best_params} (CV ROC AUC {cv_score:.4f} on {len(X_search):,} rows)")
+
+    with timer.stage("fit"):
+        pipeline = build_pipeline(C=best_params["classifier__C"], seed=args.seed)
+        pipeline.fit(X_train, y_train)
+
+    with timer.stage("explainer"):
+        X_background, _ = _stratified_sample(X_train, y_train, args.background_rows, args.seed)
+        explainer = build_explainer(pipeline, X_background)
+
+    with timer.stage("evaluate"):
+        accuracy = float(pipeline.score(X_test, y_test))
+
+    os.makedirs(args.model_dir, exist_ok=True)
+    # Artifacts are written to a scratch directory and published as a new
+    # version at the end (see model_store.py), so the app never sees a partial set
+    staging_dir = new_staging_dir(args.model_dir)
+    with timer.stage("save"):
+        save_artifacts(staging_dir, pipeline, feature_names_for(pipeline, data), explainer, X_train, X_test)
+    version = publish(args.model_dir, staging_dir, metadata={
+        "source": args.source,
+        "rows": len(data),
+        "seed": args.seed,
+        "best_params": best_params,
+        "cv_roc_auc": cv_score,
+        "test_accuracy": accuracy,
+        "timings": timer.timings,
+    })
+
+    # -----------------------------
+    # Performance Output
+    # -----------------------------
+    print(f"\nModel Training Complete.")
+    print(f"Test Accuracy: {accuracy:.3f}")
+    print(f"Stage timings (s): {timer.timings}")
+    print(f"Artifacts saved to {os.path.join(args.model_dir, version)} (now current)")
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and publish the FairFin loan model.")
+    parser.add_argument("--source", choices=["synthetic", "db", "csv", "parquet"], default="synthetic")
+    parser.add_argument("--path", help="CSV/Parquet file for --source csv/parquet")
+    parser.add_argument("--database-url", help="for --source db (defaults to $DATABASE_URL)")
+    parser.add_argument("--rows", type=int, default=1000, help="synthetic rows to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--cv", type=int, default=5, help="cross-validation folds")
+    parser.add_argument("--c-grid", type=float, nargs="+", default=DEFAULT_C_GRID,
+                        help="LogisticRegression C values to search")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="worker processes for the search (-1 = all cores)")
+    parser.add_argument("--search-rows", type=int, default=500_000,
+                        help="stratified sample size for the grid search (final fit uses all rows)")
+    parser.add_argument("--background-rows", type=int, default=1000, help="SHAP background sample size")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    args = parser.parse_args()
+
+    if args.source in ("csv", "parquet") and not args.path:
+        parser.error(f"--path is required for --source {args.source}")
+    train(args)
+
+
+if __name__ == "__main__":
+    main()
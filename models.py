@@ -1,18 +1,152 @@
 import os
+import threading
+import time
 from sqlalchemy import (
     Column, Integer, String, DateTime, ForeignKey, Enum as SAEnum,
-    JSON, Float, Boolean, create_engine, Index
+    JSON, Float, Boolean, create_engine, Index, inspect, event, select, update, bindparam
 )
+from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateColumn
 import enum
 from datetime import datetime
 
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///fairfin.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
+# Pool tuning for server databases (Postgres, MySQL, ...)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+
+# How long a SQLite writer waits for the lock before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+
+# ---------------------------
+# Pool metrics
+# ---------------------------
+class PoolMetrics:
+    """
+    Connection pool counters: checkouts, connections in use (and the peak),
+    and how long sessions waited to get a connection from the pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(self.in_use - 1, 0)
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "avg_wait_ms": round(self.wait_seconds_total / self.waits * 1000, 3) if self.waits else 0.0,
+                "max_wait_ms": round(self.wait_seconds_max * 1000, 3),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - started)
+
+
+# ---------------------------
+# Engine factory
+# ---------------------------
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while one session writes; NORMAL sync is
+    # durable in WAL mode without an fsync per commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def make_engine(database_url=DATABASE_URL):
+    """
+    Builds the SQLAlchemy engine with dialect-specific settings:
+    - SQLite: cross-thread connections, WAL, synchronous=NORMAL and a busy timeout
+    - server databases: a sized QueuePool with pre-ping and connection recycling
+    Every engine reports pool activity to `pool_metrics`.
+    """
+    url = make_url(database_url)
+
+    if url.get_backend_name() == "sqlite":
+        in_memory = url.database in (None, "", ":memory:")
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            **({} if in_memory else {"poolclass": TimedQueuePool})
+        )
+        if not in_memory:
+            event.listen(engine, "connect", _set_sqlite_pragmas)
+    else:
+        engine = create_engine(
+            url,
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+
+    event.listen(engine, "connect", lambda *_: pool_metrics.record_connect())
+    event.listen(engine, "checkout", lambda *_: pool_metrics.record_checkout())
+    event.listen(engine, "checkin", lambda *_: pool_metrics.record_checkin())
+    return engine
+
+
+def get_pool_metrics():
+    """Pool counters plus the pool's own status line."""
+    return {**pool_metrics.snapshot(), "pool_status": engine.pool.status()}
+
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(
     bind=engine,
     autocommit=False,
@@ -62,10 +196,25 @@ class LoanApplication(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
-    # Store request payload
-    application_data = Column(JSON, nullable=False)
+    # Store request payload (MutableDict: in-place changes are flushed too)
+    application_data = Column(MutableDict.as_mutable(JSON), nullable=False)
+
+    # Typed copies of the model features (see FEATURE_COLUMNS), kept in sync
+    # with application_data so they can be filtered/sorted in SQL and read
+    # column-wise for scoring
+    loan_amount = Column(Float, nullable=True)
+    loan_tenure_months = Column(Integer, nullable=True)
+    employment_type = Column(String(32), nullable=True)
+    annual_income = Column(Float, nullable=True)
+    credit_score = Column(Integer, nullable=True)
+    existing_loans = Column(Integer, nullable=True)
+    monthly_expenses = Column(Float, nullable=True)
+    gender = Column(String(16), nullable=True)
+    region = Column(String(32), nullable=True)
 
     decision = Column(String(20), nullable=True)
+    # Model version whose score the analyst saw when deciding
+    decision_model_version = Column(String(64), nullable=True)
 
     status = Column(
         SAEnum(LoanStatus),
@@ -77,12 +226,65 @@ class LoanApplication(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
+    # Bumped whenever application_data changes (approved EditRequest)
+    data_version = Column(Integer, default=1, server_default="1", nullable=False)
+
+    # Persisted model output for the current data version (see scoring.py)
+    score = Column(Float, nullable=True)
+    predicted_class = Column(Integer, nullable=True)
+    top_contributions = Column(JSON, nullable=True)  # [[feature_name, contribution], ...]
+    model_version = Column(String(64), nullable=True)
+
     user = relationship("User", back_populates="loans")
     edit_requests = relationship("EditRequest", back_populates="loan", cascade="all, delete-orphan")
 
 
+# Model feature name (application_data key) → typed LoanApplication column
+FEATURE_COLUMNS = {
+    "Loan_Amount": "loan_amount",
+    "Loan_Tenure_Months": "loan_tenure_months",
+    "Employment_Type": "employment_type",
+    "Annual_Income": "annual_income",
+    "Credit_Score": "credit_score",
+    "Existing_Loans": "existing_loans",
+    "Monthly_Expenses": "monthly_expenses",
+    "Gender": "gender",
+    "Region": "region",
+}
+
+
+def _coerce(column, value):
+    if value is None:
+        return None
+    try:
+        return column.type.python_type(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def feature_values(application_data):
+    """Typed column values ({column_name: value}) for an application_data dict."""
+    data = application_data or {}
+    return {
+        attr: _coerce(LoanApplication.__table__.c[attr], data.get(feature))
+        for feature, attr in FEATURE_COLUMNS.items()
+    }
+
+
+@event.listens_for(LoanApplication, "before_insert")
+@event.listens_for(LoanApplication, "before_update")
+def _sync_feature_columns(mapper, connection, target):
+    # Bulk UPDATEs bypass this hook and pass feature_values() themselves
+    for attr, value in feature_values(target.application_data).items():
+        setattr(target, attr, value)
+
+
 # Add index so analysts/admins can quickly fetch pending items
-Index("idx_loan_status", LoanApplication.status)
+# (status first, then the (created_at, id) keyset order of the queue pages)
+Index("idx_loan_status_created", LoanApplication.status, LoanApplication.created_at, LoanApplication.id)
+
+# A user's history, newest first, by the same keyset
+Index("idx_loan_user_created", LoanApplication.user_id, LoanApplication.created_at, LoanApplication.id)
 
 
 # ---------------------------
@@ -96,9 +298,21 @@ class AuditLog(Base):
     action = Column(String(500), nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
 
+    # Structured event: user_id is the actor; action stays as the readable text.
+    # Null on rows written before these columns existed.
+    verb = Column(String(32), nullable=True)
+    target_type = Column(String(32), nullable=True)
+    target_id = Column(Integer, nullable=True)
+
     user = relationship("User", back_populates="auditlogs")
 
 
+# Time-range reads and the retention job walk the log in time order
+Index("idx_audit_timestamp", AuditLog.timestamp, AuditLog.id)
+# History of one loan / edit request
+Index("idx_audit_target", AuditLog.target_type, AuditLog.target_id, AuditLog.timestamp)
+
+
 # ---------------------------
 # Edit Request Table
 # ---------------------------
@@ -122,11 +336,206 @@ class EditRequest(Base):
     loan = relationship("LoanApplication", back_populates="edit_requests")
 
 
+# Admin queue: pending requests oldest first; loan → requests lookups
+Index("idx_edit_request_status_created", EditRequest.status, EditRequest.created_at, EditRequest.id)
+Index("idx_edit_request_loan", EditRequest.loan_application_id)
+
+
+# ---------------------------
+# Scoring Job Queue
+# ---------------------------
+class ScoringJob(Base):
+    """
+    Durable work item for scoring_worker.py. A worker claims a job by moving it
+    to "running" with its own claim_token and a lease; a job whose lease has
+    expired (worker crashed or hung) can be claimed again.
+    """
+    __tablename__ = "scoring_jobs"
+
+    id = Column(Integer, primary_key=True)
+    loan_application_id = Column(Integer, ForeignKey("loan_applications.id"), nullable=False)
+
+    status = Column(String(20), default="queued", nullable=False)  # queued|running|done|failed
+    attempts = Column(Integer, default=0, nullable=False)
+
+    claim_token = Column(String(32), nullable=True, index=True)
+    worker_id = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(String(500), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    loan = relationship("LoanApplication")
+
+
+# Workers look for queued jobs (FIFO by id) and for running jobs with an expired lease
+Index("idx_scoring_job_claim", ScoringJob.status, ScoringJob.lease_expires_at)
+Index("idx_scoring_job_queue", ScoringJob.status, ScoringJob.id)
+Index("idx_scoring_job_loan", ScoringJob.loan_application_id, ScoringJob.status)
+
+
+# ---------------------------
+# Fairness Aggregates
+# ---------------------------
+class FairnessAggregate(Base):
+    """
+    Running counters per protected-attribute group (e.g. Gender = Female),
+    maintained incrementally by fairness.py as loans are scored and decided.
+    """
+    __tablename__ = "fairness_aggregates"
+
+    id = Column(Integer, primary_key=True)
+    attribute = Column(String(32), nullable=False)     # Gender | Region | Employment_Type
+    group_value = Column(String(64), nullable=False)
+
+    decided = Column(Integer, default=0, server_default="0", nullable=False)
+    approved = Column(Integer, default=0, server_default="0", nullable=False)
+    scored = Column(Integer, default=0, server_default="0", nullable=False)
+    score_sum = Column(Float, default=0.0, server_default="0", nullable=False)
+    predicted_approved = Column(Integer, default=0, server_default="0", nullable=False)
+    # Approved loans that have a score, and those the model also predicted as approved
+    positives = Column(Integer, default=0, server_default="0", nullable=False)
+    true_positives = Column(Integer, default=0, server_default="0", nullable=False)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+Index("idx_fairness_group", FairnessAggregate.attribute, FairnessAggregate.group_value, unique=True)
+
+
+# ---------------------------
+# Drift Histograms
+# ---------------------------
+class DriftCount(Base):
+    """
+    Histogram counter of scored applications: how many fell into `bin` of
+    `feature` (the bins of the model version's drift reference, see drift.py)
+    during the time bucket starting at window_start.
+    """
+    __tablename__ = "drift_counts"
+
+    id = Column(Integer, primary_key=True)
+    model_version = Column(String(64), nullable=False)
+    feature = Column(String(64), nullable=False)
+    window_start = Column(DateTime, nullable=False)
+    bin = Column(Integer, nullable=False)
+    count = Column(Integer, default=0, server_default="0", nullable=False)
+
+
+Index("idx_drift_bucket", DriftCount.model_version, DriftCount.window_start, DriftCount.feature, DriftCount.bin, unique=True)
+
+
+# ---------------------------
+# Offline Rescoring Results
+# ---------------------------
+class RescoreResult(Base):
+    """
+    Score of a loan under a given model version, written by rescore.py so
+    versions can be compared without touching the loan's stored score.
+    """
+    __tablename__ = "rescore_results"
+
+    loan_application_id = Column(Integer, ForeignKey("loan_applications.id"), primary_key=True)
+    model_version = Column(String(64), primary_key=True)
+    data_version = Column(Integer, nullable=False)  # the loan's data_version when it was scored
+
+    score = Column(Float, nullable=True)
+    predicted_class = Column(Integer, nullable=True)
+    top_contributions = Column(JSON, nullable=True)
+
+    rescored_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 # ---------------------------
 # Init DB
 # ---------------------------
+_db_initialized = False
+_db_init_lock = threading.Lock()
+
+
+def _add_missing_columns():
+    """
+    Lightweight schema migration: create_all() never alters existing tables,
+    so columns added to the models later are appended with ALTER TABLE.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+
+
+def _create_missing_indexes():
+    """Indexes declared after a table was created are not added by create_all()."""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+# Indexes superseded by the ones above; kept out of existing databases so
+# they stop adding write cost (idx_loan_status → idx_loan_status_created)
+RETIRED_INDEXES = ["idx_loan_status"]
+
+
+def _drop_retired_indexes():
+    with engine.begin() as conn:
+        for name in RETIRED_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+
+def _backfill_feature_columns(batch_size=1000):
+    """Fills the typed feature columns of rows written before they existed."""
+    table = LoanApplication.__table__
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.application_data)
+                .where(table.c.loan_amount.is_(None), table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return
+            conn.execute(
+                update(table).where(table.c.id == bindparam("b_id")).values(
+                    {attr: bindparam(f"b_{attr}") for attr in FEATURE_COLUMNS.values()}
+                ),
+                [
+                    {"b_id": row.id, **{f"b_{attr}": value for attr, value in feature_values(row.application_data).items()}}
+                    for row in rows
+                ],
+            )
+            last_id = rows[-1].id
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    """
+    Creates missing tables, columns and indexes. Streamlit reruns app.py on every
+    interaction, so the schema check only runs once per process.
+    """
+    global _db_initialized
+    if _db_initialized:
+        return
+
+    with _db_init_lock:
+        if not _db_initialized:
+            Base.metadata.create_all(bind=engine)
+            _add_missing_columns()
+            _create_missing_indexes()
+            _drop_retired_indexes()
+            _backfill_feature_columns()
+            # Imported here: fairness.py builds on the models above
+            from fairness import ensure_aggregates
+            ensure_aggregates()
+            _db_initialized = True
 
 
 if __name__ == "__main__":
@@ -0,0 +1,285 @@
+"""
+Offline bulk rescoring of the whole loan book.
+
+Rescores and explains every LoanApplication with the deployed model, e.g.
+after a new model version is published, so old and new scores can be
+compared. Rows are streamed out of the database in id order with a
+server-side cursor (stream_results/yield_per), scored in chunks by a pool
+of worker processes, and written in id order, one bulk statement per chunk,
+to one of:
+
+- the rescore_results table (default), one row per loan and model version;
+  the loans' stored scores are left as they are,
+- Parquet part files (--output DIR),
+- the loan rows themselves (--in-place, see scoring.write_scores), replacing
+  the stored scores; the fairness aggregates follow them, the drift
+  counters are not touched.
+
+At most --in-flight chunks are held at any time, so memory stays bounded
+whatever the table size.
+
+After each chunk is written the last loan id is saved to a checkpoint file;
+a rerun continues after it. A checkpoint taken with a different model
+version is discarded and the run starts over.
+
+    python rescore.py --processes 4
+    python rescore.py --output rescored/ --chunk-size 20000
+    python rescore.py --in-place
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import select, delete, insert
+
+from models import init_db, engine, LoanApplication, RescoreResult, FEATURE_COLUMNS
+from services import session_scope
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_CHECKPOINT = "rescore_checkpoint.json"
+PROGRESS_SECONDS = 5.0
+
+
+# -------------------------
+# Scoring (runs in the worker processes)
+# -------------------------
+def _init_worker():
+    # Load the artifacts once per process rather than on its first chunk
+    from analysis import load_scoring_model, load_explainer
+
+    load_scoring_model()
+    load_explainer()
+
+
+def score_chunk(columns, n_rows):
+    """Scores a column batch ({feature: values}); see scoring.score_applications."""
+    from analysis import build_input_dataframe_columns
+    from scoring import score_applications
+
+    return score_applications(build_input_dataframe_columns(columns, n_rows))
+
+
+# -------------------------
+# Checkpoints
+# -------------------------
+def load_checkpoint(path, model_version, output):
+    """Last written loan id and row count, or a fresh start if the checkpoint does not apply."""
+    fresh = {"model_version": model_version, "output": output, "last_id": 0, "rows": 0}
+    try:
+        with open(path, encoding="utf-8") as fh:
+            checkpoint = json.load(fh)
+    except FileNotFoundError:
+        return fresh
+
+    if checkpoint.get("model_version") != model_version or checkpoint.get("output") != output:
+        print(f"⚠ Checkpoint {path} is for model {checkpoint.get('model_version')} "
+              f"→ {checkpoint.get('output')}; starting over.")
+        return fresh
+    print(f"Resuming after loan {checkpoint['last_id']} ({checkpoint['rows']:,} rows already rescored).")
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump({**checkpoint, "updated_at": datetime.utcnow().isoformat()}, fh)
+    os.replace(tmp_path, path)
+
+
+# -------------------------
+# Reading and writing
+# -------------------------
+def iter_chunks(after_id, chunk_size):
+    """(rows, columns) per chunk of loans with id > after_id, via a server-side cursor."""
+    stmt = (
+        select(
+            LoanApplication.id,
+            LoanApplication.data_version,
+            LoanApplication.status,
+            LoanApplication.score,
+            LoanApplication.predicted_class,
+            *[getattr(LoanApplication, attr) for attr in FEATURE_COLUMNS.values()],
+        )
+        .where(LoanApplication.id > after_id)
+        .order_by(LoanApplication.id)
+    )
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+        for rows in result.partitions():
+            columns = {feature: [getattr(row, attr) for row in rows] for feature, attr in FEATURE_COLUMNS.items()}
+            yield rows, columns
+
+
+def write_to_table(rows, results):
+    """Writes a chunk to rescore_results, replacing rows of an interrupted earlier attempt."""
+    with session_scope() as s:
+        s.execute(
+            delete(RescoreResult)
+            .where(RescoreResult.model_version == results[0]["model_version"])
+            .where(RescoreResult.loan_application_id.between(rows[0].id, rows[-1].id))
+        )
+        s.execute(insert(RescoreResult), [
+            {
+                "loan_application_id": row.id,
+                "model_version": result["model_version"],
+                "data_version": row.data_version,
+                "score": result["score"],
+                "predicted_class": result["predicted_class"],
+                "top_contributions": result["top_contributions"],
+            }
+            for row, result in zip(rows, results)
+        ])
+
+
+def write_in_place(rows, results):
+    from scoring import write_scores
+
+    # previous=rows moves the fairness aggregates from the old scores to the new
+    # ones, so they keep matching the stored scores; drift only counts new traffic
+    with session_scope() as s:
+        write_scores(s, [(row.id, row.data_version) for row in rows], results, previous=rows, record_drift=False)
+
+
+def write_to_parquet(output_dir, rows, results):
+    """One part file per chunk, written to a temporary name and renamed into place."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    ids = [row.id for row in rows]
+    table = pa.table({
+        "loan_id": pa.array(ids, type=pa.int64()),
+        "data_version": pa.array([row.data_version for row in rows], type=pa.int64()),
+        "score": pa.array([r["score"] for r in results], type=pa.float64()),
+        "predicted_class": pa.array([r["predicted_class"] for r in results], type=pa.int8()),
+        "top_contributions": pa.array([json.dumps(r["top_contributions"]) for r in results], type=pa.string()),
+        "model_version": pa.array([r["model_version"] for r in results], type=pa.string()),
+    })
+    name = f"part-{ids[0]:012d}-{ids[-1]:012d}.parquet"
+    # Dot-prefixed while being written, so dataset readers skip a half-written file
+    tmp_path = os.path.join(output_dir, f".{name}.tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, os.path.join(output_dir, name))
+
+
+# -------------------------
+# Driver
+# -------------------------
+def rescore(chunk_size=DEFAULT_CHUNK_SIZE, processes=None, in_flight=None, output=None, in_place=False,
+            checkpoint_path=DEFAULT_CHECKPOINT):
+    """
+    Rescores every loan after the checkpoint into rescore_results, the Parquet
+    directory `output`, or with in_place the loan rows. Returns the number of
+    rows rescored in this run.
+    """
+    from analysis import model_version, load_scoring_model
+
+    init_db()
+    if load_scoring_model() is None:
+        raise SystemExit("❌ No model is deployed; nothing to rescore with.")
+    version = model_version()
+
+    if output:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise SystemExit("❌ Writing Parquet needs pyarrow (pip install pyarrow).") from e
+        os.makedirs(output, exist_ok=True)
+
+    target = output or ("loan rows" if in_place else RescoreResult.__tablename__)
+    checkpoint = load_checkpoint(checkpoint_path, version, target)
+    processes = processes or os.cpu_count() or 1
+    in_flight = in_flight or 2 * processes
+
+    def write(rows, results):
+        if not results:
+            raise RuntimeError(f"Scoring returned no results for loans {rows[0].id}–{rows[-1].id}")
+        changed = {r["model_version"] for r in results} - {version}
+        if changed:
+            raise SystemExit(f"❌ Model changed during the run ({version} → {changed.pop()}); "
+                             f"rerun to rescore with the new version.")
+        if output:
+            write_to_parquet(output, rows, results)
+        elif in_place:
+            write_in_place(rows, results)
+        else:
+            write_to_table(rows, results)
+        checkpoint["last_id"] = rows[-1].id
+        checkpoint["rows"] += len(rows)
+        save_checkpoint(checkpoint_path, checkpoint)
+        return len(rows)
+
+    print(f"Rescoring with model {version} → {target} "
+          f"({processes} process(es), chunks of {chunk_size:,})")
+    started = last_report = time.perf_counter()
+    done = 0
+
+    def report(final=False):
+        nonlocal last_report
+        now = time.perf_counter()
+        if final or now - last_report >= PROGRESS_SECONDS:
+            last_report = now
+            elapsed = now - started
+            print(f"{done:,} rows in {elapsed:.1f}s ({done / elapsed if elapsed else 0:,.0f} rows/s), "
+                  f"last loan {checkpoint['last_id']}")
+
+    chunks = iter_chunks(checkpoint["last_id"], chunk_size)
+    if processes <= 1:
+        for rows, columns in chunks:
+            done += write(rows, score_chunk(columns, len(rows)))
+            report()
+    else:
+        # Results are written in submission (id) order, so the checkpoint never
+        # skips past a chunk that is still being scored
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_init_worker) as pool:
+            pending = deque()
+            for rows, columns in chunks:
+                pending.append((rows, pool.submit(score_chunk, columns, len(rows))))
+                if len(pending) >= in_flight:
+                    rows, future = pending.popleft()
+                    done += write(rows, future.result())
+                    report()
+            while pending:
+                rows, future = pending.popleft()
+                done += write(rows, future.result())
+                report()
+
+    report(final=True)
+    print(f"Rescored {checkpoint['rows']:,} loans in total with model {version}.")
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore every loan application with the deployed model.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--processes", type=int, default=None, help="scoring processes (default: all cores)")
+    parser.add_argument("--in-flight", type=int, default=None,
+                        help="max chunks read but not yet written (default: 2 per process)")
+    destination = parser.add_mutually_exclusive_group()
+    destination.add_argument("--output", help="directory for Parquet part files instead of the rescore_results table")
+    destination.add_argument("--in-place", action="store_true",
+                             help="replace the loans' stored scores instead of writing rescore_results")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    rescore(
+        chunk_size=args.chunk_size,
+        processes=args.processes,
+        in_flight=args.in_flight,
+        output=args.output,
+        in_place=args.in_place,
+        checkpoint_path=args.checkpoint,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Persisted model outputs for loan applications.
+
+The probability, predicted class and top SHAP contributions are computed once
+per (application data version, model version) and stored on the
+LoanApplication row, so dashboards only read them back. A stored score is
+stale when it was never computed or was computed by a different model
+artifact than the one currently deployed.
+"""
+
+import pandas as pd
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.orm import object_session
+
+import drift
+import fairness
+from models import LoanApplication, FEATURE_COLUMNS
+from analysis import (
+    build_input_dataframe_columns,
+    load_scoring_model,
+    load_explainer,
+    load_feature_names,
+    model_version,
+    predict_proba_and_class_batch,
+    explain_batch
+)
+
+# Enough for the analyst plot (6 bars); the text explanation uses the first 3
+TOP_CONTRIBUTIONS = 6
+
+
+def feature_frame(rows):
+    """
+    Model input for rows carrying the typed feature columns (LoanApplication
+    objects or query rows), assembled column by column.
+    """
+    rows = list(rows)
+    columns = {
+        feature: [getattr(row, attr) for row in rows]
+        for feature, attr in FEATURE_COLUMNS.items()
+    }
+    return build_input_dataframe_columns(columns, len(rows))
+
+
+def score_applications(applications):
+    """
+    Scores and explains a batch in one pass. `applications` is a list of
+    application_data dicts or an input frame from feature_frame().
+
+    Returns one dict per application with keys score, predicted_class,
+    top_contributions and model_version, or None when no model is deployed.
+    """
+    if not isinstance(applications, pd.DataFrame):
+        applications = list(applications)
+    model = load_scoring_model()
+    if model is None or len(applications) == 0:
+        return None
+
+    probas, preds = predict_proba_and_class_batch(model, applications)
+
+    contributions = [None] * len(applications)
+    explainer = load_explainer()
+    if explainer is not None:
+        try:
+            contributions = explain_batch(
+                explainer,
+                model,
+                applications,
+                feature_names=load_feature_names(),
+                topk=TOP_CONTRIBUTIONS
+            )
+        except Exception as e:
+            print("⚠ Could not explain applications:", e)
+
+    version = model_version()
+    return [
+        {
+            "score": float(p),
+            "predicted_class": int(c),
+            "top_contributions": [[name, value] for name, value in contrib] if contrib is not None else None,
+            "model_version": version,
+        }
+        for p, c, contrib in zip(probas, preds, contributions)
+    ]
+
+
+def is_stale(loan, current_model_version):
+    """True when the loan has no stored score for the currently deployed model."""
+    return loan.score is None or loan.model_version != current_model_version
+
+
+def score_loans(loans, only_stale=True):
+    """
+    Computes and assigns model outputs on LoanApplication objects (attached to a
+    session by the caller, which commits). Returns the loans that were scored.
+    """
+    if only_stale:
+        current = model_version()
+        loans = [loan for loan in loans if is_stale(loan, current)]
+
+    results = score_applications(feature_frame(loans))
+    if not results:
+        return []
+
+    scored = []
+    for loan, result in zip(loans, results):
+        scored.append((loan, (loan.status, loan.score, loan.predicted_class), result))
+        loan.score = result["score"]
+        loan.predicted_class = result["predicted_class"]
+        loan.top_contributions = result["top_contributions"]
+        loan.model_version = result["model_version"]
+
+    session = object_session(loans[0])
+    if session is not None:
+        _record_outcomes(session, scored)
+    return loans
+
+
+def _record_outcomes(session, scored, record_drift=True):
+    """
+    Moves the fairness aggregates and, with record_drift, counts first-time
+    scores for drift.
+    `scored` holds (row, (status, old score, old predicted class), result).
+    """
+    fairness.record_changes(session, [
+        (
+            row,
+            fairness.loan_counters(*before),
+            fairness.loan_counters(before[0], result["score"], result["predicted_class"]),
+        )
+        for row, before, result in scored
+    ])
+
+    # Drift watches incoming applications, so each one counts once (rescoring does not)
+    new = [(row, result) for row, before, result in scored if before[1] is None] if record_drift else []
+    if new:
+        drift.record(
+            session,
+            [row for row, _ in new],
+            [result["score"] for _, result in new],
+            new[0][1]["model_version"],
+        )
+
+
+def write_scores(session, keys, results, previous=None, record_drift=True):
+    """
+    Set-based write-back for background scoring: one executemany UPDATE keyed by
+    (loan id, data version). A row whose data changed after it was read (its
+    data_version moved on) is left alone, so a stale result never overwrites it.
+
+    `keys` is a list of (loan_id, data_version) aligned with `results`.
+    `previous`, when given, holds the rows as read before scoring (status,
+    score, predicted_class and the feature columns, aligned with `keys`);
+    the fairness aggregates and drift counters are then updated for the
+    rows that were written. record_drift=False leaves the drift counters
+    alone (offline rescoring is not incoming traffic).
+    Returns the number of rows updated.
+    """
+    if not results:
+        return 0
+
+    stmt = (
+        update(LoanApplication)
+        .where(LoanApplication.id == bindparam("b_id"))
+        .where(LoanApplication.data_version == bindparam("b_data_version"))
+        .values(
+            score=bindparam("b_score"),
+            predicted_class=bindparam("b_predicted_class"),
+            top_contributions=bindparam("b_top_contributions", type_=LoanApplication.top_contributions.type),
+            model_version=bindparam("b_model_version"),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    params = [
+        {
+            "b_id": loan_id,
+            "b_data_version": data_version,
+            "b_score": result["score"],
+            "b_predicted_class": result["predicted_class"],
+            "b_top_contributions": result["top_contributions"],
+            "b_model_version": result["model_version"],
+        }
+        for (loan_id, data_version), result in zip(keys, results)
+    ]
+    updated = session.connection().execute(stmt, params).rowcount
+
+    if previous is not None:
+        rows = list(zip(keys, previous, results))
+        if updated < len(rows):
+            # Some rows changed under us; only the ones still at the version read were written
+            current = dict(session.execute(
+                select(LoanApplication.id, LoanApplication.data_version)
+                .where(LoanApplication.id.in_([loan_id for loan_id, _ in keys]))
+            ).all())
+            rows = [row for row in rows if current.get(row[0][0]) == row[0][1]]
+        _record_outcomes(session, [
+            (before, (before.status, before.score, before.predicted_class), result)
+            for _, before, result in rows
+        ], record_drift=record_drift)
+    return updated
@@ -0,0 +1,313 @@
+"""
+Background scoring worker for FairFin.
+
+Claims jobs from the scoring_jobs table (see models.ScoringJob), scores the
+corresponding loan applications in batches with the deployed pipeline and
+writes the results back, so no scoring happens in Streamlit's request thread.
+
+Claiming is a conditional UPDATE (queued, or running with an expired lease →
+running with this worker's claim token), which the database applies
+atomically per row, so each job is claimed by exactly one worker. Jobs of a
+crashed worker are picked up again once their lease expires. Several worker
+processes can run side by side on one box:
+
+    python scoring_worker.py --processes 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from models import init_db, LoanApplication, LoanStatus, ScoringJob, FEATURE_COLUMNS
+from services import session_scope, enqueue_scoring
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_POLL_SECONDS = 2.0
+DEFAULT_SWEEP_SECONDS = 60.0
+MAX_ATTEMPTS = 5
+
+
+# -------------------------
+# Queue operations
+# -------------------------
+def _claimable(now):
+    return and_(
+        ScoringJob.attempts < MAX_ATTEMPTS,
+        or_(
+            ScoringJob.status == "queued",
+            and_(ScoringJob.status == "running", ScoringJob.lease_expires_at < now),
+        ),
+    )
+
+
+def claim_jobs(session, worker_id, batch_size=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Claims up to `batch_size` jobs for this worker and returns (claim_token, jobs).
+    The claim is committed by the caller's session_scope.
+    """
+    now = datetime.utcnow()
+
+    # Two index-ordered range reads instead of one OR query that would need a
+    # sort over the whole backlog: expired leases first, then FIFO queued jobs
+    expired = (
+        session.query(ScoringJob.id)
+        .filter(ScoringJob.status == "running", ScoringJob.lease_expires_at < now)
+        .filter(ScoringJob.attempts < MAX_ATTEMPTS)
+        .order_by(ScoringJob.lease_expires_at)
+    )
+    queued = (
+        session.query(ScoringJob.id)
+        .filter(ScoringJob.status == "queued", ScoringJob.attempts < MAX_ATTEMPTS)
+        .order_by(ScoringJob.id)
+    )
+
+    candidate_ids = []
+    for candidates in (expired, queued):
+        if session.bind.dialect.name == "postgresql":
+            # Concurrent workers skip rows another worker is claiming instead of queueing behind it
+            candidates = candidates.with_for_update(skip_locked=True)
+        candidate_ids += [job_id for (job_id,) in candidates.limit(batch_size - len(candidate_ids))]
+        if len(candidate_ids) >= batch_size:
+            break
+    if not candidate_ids:
+        return None, []
+
+    claim_token = uuid.uuid4().hex
+    # The claimable predicate is re-checked by the UPDATE itself, so a job that
+    # another worker claimed in the meantime is simply not matched here
+    (
+        session.query(ScoringJob)
+        .filter(ScoringJob.id.in_(candidate_ids), _claimable(now))
+        .update(
+            {
+                ScoringJob.status: "running",
+                ScoringJob.claim_token: claim_token,
+                ScoringJob.worker_id: worker_id,
+                ScoringJob.lease_expires_at: now + timedelta(seconds=lease_seconds),
+                ScoringJob.attempts: ScoringJob.attempts + 1,
+                ScoringJob.updated_at: now,
+            },
+            synchronize_session=False,
+        )
+    )
+
+    jobs = session.query(ScoringJob).filter(ScoringJob.claim_token == claim_token).all()
+    return claim_token, jobs
+
+
+def _finish_jobs(session, claim_token, status, error=None):
+    """Marks this claim's jobs done/queued/failed; a claim lost to lease expiry is not touched."""
+    values = {
+        ScoringJob.status: status,
+        ScoringJob.lease_expires_at: None,
+        ScoringJob.updated_at: datetime.utcnow(),
+    }
+    if error is not None:
+        values[ScoringJob.last_error] = str(error)[:500]
+
+    query = session.query(ScoringJob).filter(
+        ScoringJob.claim_token == claim_token,
+        ScoringJob.status == "running",
+    )
+    if status == "queued":
+        # Give up on jobs that keep failing
+        query.filter(ScoringJob.attempts >= MAX_ATTEMPTS).update(
+            {**values, ScoringJob.status: "failed"}, synchronize_session=False
+        )
+    query.update(values, synchronize_session=False)
+
+
+def _requeue_edited(session, claim_token, rows):
+    """
+    Puts this claim's jobs back in the queue for loans whose data changed after
+    `rows` was read. Their stale scores were not written, and the edit found
+    this job still open so it queued none of its own.
+    """
+    read = {row.id: row.data_version for row in rows}
+    edited = [
+        loan_id for loan_id, data_version in
+        session.query(LoanApplication.id, LoanApplication.data_version).filter(LoanApplication.id.in_(read))
+        if data_version != read[loan_id]
+    ]
+    if not edited:
+        return 0
+    return (
+        session.query(ScoringJob)
+        .filter(
+            ScoringJob.claim_token == claim_token,
+            ScoringJob.status == "running",
+            ScoringJob.loan_application_id.in_(edited),
+        )
+        .update(
+            {
+                ScoringJob.status: "queued",
+                ScoringJob.lease_expires_at: None,
+                # Not a failed attempt
+                ScoringJob.attempts: ScoringJob.attempts - 1,
+                ScoringJob.updated_at: datetime.utcnow(),
+            },
+            synchronize_session=False,
+        )
+    )
+
+
+def process_batch(worker_id, batch_size=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Claims, scores and completes one batch. Returns the number of jobs processed.
+    """
+    # Imported here so the queue helpers above stay light for the web app
+    from scoring import score_applications, feature_frame, write_scores
+
+    with session_scope() as s:
+        claim_token, jobs = claim_jobs(s, worker_id, batch_size, lease_seconds)
+    if not jobs:
+        return 0
+
+    try:
+        with session_scope() as s:
+            loan_ids = sorted({job.loan_application_id for job in jobs})
+            # Typed feature columns only; the JSON payload is never decoded here
+            feature_cols = [getattr(LoanApplication, attr) for attr in FEATURE_COLUMNS.values()]
+            # Previous status/score come along so the fairness aggregates can be moved
+            rows = (
+                s.query(
+                    LoanApplication.id, LoanApplication.data_version, *feature_cols,
+                    LoanApplication.status, LoanApplication.score, LoanApplication.predicted_class,
+                )
+                .filter(LoanApplication.id.in_(loan_ids))
+                .all()
+            )
+            results = score_applications(feature_frame(rows))
+            if results:
+                written = write_scores(s, [(row.id, row.data_version) for row in rows], results, previous=rows)
+                if written < len(rows):
+                    _requeue_edited(s, claim_token, rows)
+            _finish_jobs(s, claim_token, "done")
+    except Exception as e:
+        print(f"⚠ [{worker_id}] scoring batch failed:", e)
+        with session_scope() as s:
+            _finish_jobs(s, claim_token, "queued", error=e)
+
+    return len(jobs)
+
+
+def enqueue_stale(limit=1000):
+    """
+    Queues pending loans that were never scored or were scored by an older
+    model artifact. Returns the number of jobs created.
+    """
+    from analysis import model_version
+
+    current = model_version()
+    if current is None:
+        return 0
+
+    with session_scope() as s:
+        stale_ids = [
+            loan_id for (loan_id,) in
+            s.query(LoanApplication.id)
+            .filter(LoanApplication.status == LoanStatus.pending)
+            .filter(or_(
+                LoanApplication.score.is_(None),
+                LoanApplication.model_version.is_(None),
+                LoanApplication.model_version != current,
+            ))
+            .order_by(LoanApplication.id)
+            .limit(limit)
+        ]
+        return enqueue_scoring(s, stale_ids)
+
+
+# -------------------------
+# Worker loop
+# -------------------------
+def run_worker(batch_size=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS,
+               poll_seconds=DEFAULT_POLL_SECONDS, sweep_seconds=DEFAULT_SWEEP_SECONDS, once=False):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+    init_db()
+    print(f"Scoring worker {worker_id} started.")
+
+    next_sweep = 0.0
+    while not stopping:
+        started = time.perf_counter()
+        try:
+            if sweep_seconds and time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + sweep_seconds
+                queued = enqueue_stale()
+                if queued:
+                    print(f"[{worker_id}] queued {queued} stale applications")
+
+            processed = process_batch(worker_id, batch_size, lease_seconds)
+        except Exception as e:
+            # e.g. a lock timeout while claiming; unfinished claims are reclaimed after the lease
+            print(f"⚠ [{worker_id}] queue error:", e)
+            processed = 0
+
+        if processed:
+            elapsed = time.perf_counter() - started
+            print(f"[{worker_id}] scored {processed} jobs in {elapsed * 1000:.0f} ms")
+            continue
+
+        if once:
+            break
+        time.sleep(poll_seconds)
+
+    print(f"Scoring worker {worker_id} stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score queued loan applications in the background.")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to run on this box")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS,
+                        help="claimed jobs are reclaimable after this long")
+    parser.add_argument("--poll-seconds", type=float, default=DEFAULT_POLL_SECONDS)
+    parser.add_argument("--sweep-seconds", type=float, default=DEFAULT_SWEEP_SECONDS,
+                        help="how often to queue unscored/stale pending loans (0 disables)")
+    parser.add_argument("--once", action="store_true", help="drain the queue and exit")
+    args = parser.parse_args()
+
+    options = dict(
+        batch_size=args.batch_size,
+        lease_seconds=args.lease_seconds,
+        poll_seconds=args.poll_seconds,
+        sweep_seconds=args.sweep_seconds,
+        once=args.once,
+    )
+
+    if args.processes <= 1:
+        run_worker(**options)
+        return
+
+    # Each process gets its own DB engine and model artifacts; only the first
+    # one sweeps for stale loans so the sweeps do not race each other
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=run_worker, kwargs={**options, "sweep_seconds": options["sweep_seconds"] if i == 0 else 0})
+        for i in range(args.processes)
+    ]
+    for proc in workers:
+        proc.start()
+    try:
+        for proc in workers:
+            proc.join()
+    except KeyboardInterrupt:
+        for proc in workers:
+            proc.terminate()
+        for proc in workers:
+            proc.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 from contextlib import contextmanager
-from models import SessionLocal, User, LoanApplication, EditRequest, AuditLog, LoanStatus
+from models import SessionLocal, User, LoanApplication, EditRequest, LoanStatus, ScoringJob, feature_values
+from sqlalchemy import tuple_, update
+from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import NoResultFound, IntegrityError
+import audit
+import fairness
+
+DEFAULT_PAGE_SIZE = 20
 
 
 @contextmanager
@@ -62,7 +68,7 @@ def get_or_create_user(session, auth0_id, name, email):
 # --------------------------------------------
 def save_loan(session, user_id, application_data):
     """
-    Creates a new loan entry with pending status.
+    Creates a new loan entry with pending status and queues it for scoring.
     """
     loan = LoanApplication(
         user_id=user_id,
@@ -71,6 +77,7 @@ def save_loan(session, user_id, application_data):
     )
     session.add(loan)
     session.flush()
+    enqueue_scoring(session, [loan.id])
     session.refresh(loan)
     return loan
 
@@ -93,9 +100,246 @@ def list_pending_loans(session):
     )
 
 
+def record_decision(session, loan_id, decision, explanation, model_version=None):
+    """
+    Applies an analyst decision ("approved" or "denied") with a single UPDATE,
+    only while the loan is still pending. `model_version` is the version of the
+    model whose score the decision was based on. Returns True if the loan was updated.
+    The fairness aggregates are moved in the same transaction.
+    """
+    before = (
+        session.query(
+            LoanApplication.score, LoanApplication.predicted_class,
+            *[getattr(LoanApplication, attr) for attr in fairness.FAIRNESS_ATTRIBUTES.values()]
+        )
+        .filter(LoanApplication.id == loan_id)
+        .one_or_none()
+    )
+    updated = (
+        session.query(LoanApplication)
+        .filter(LoanApplication.id == loan_id, LoanApplication.status == LoanStatus.pending)
+        .update(
+            {
+                LoanApplication.status: LoanStatus(decision),
+                LoanApplication.decision: decision,
+                LoanApplication.explanation: explanation,
+                LoanApplication.decision_model_version: model_version,
+            },
+            synchronize_session=False
+        )
+    )
+    if updated == 1:
+        fairness.record_changes(session, [(
+            before,
+            fairness.loan_counters(LoanStatus.pending, before.score, before.predicted_class),
+            fairness.loan_counters(decision, before.score, before.predicted_class),
+        )])
+    return updated == 1
+
+
+# --------------------------------------------
+# KEYSET PAGINATION
+# --------------------------------------------
+# Pages are ordered by (created_at, id) and addressed by the last row seen,
+# so each page is a bounded index range scan no matter how big the table gets.
+def _keyset_page(rows, limit):
+    """
+    Splits an over-fetched (limit + 1) result into (page_rows, next_cursor).
+    next_cursor is None when there is no further page.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = (rows[-1].created_at, rows[-1].id) if has_more and rows else None
+    return rows, next_cursor
+
+
+def list_user_loans_page(session, user_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of a user's loans, newest first.
+    Returns (loans, next_cursor); pass next_cursor back in to fetch the following page.
+    """
+    key = tuple_(LoanApplication.created_at, LoanApplication.id)
+    query = session.query(LoanApplication).filter(LoanApplication.user_id == user_id)
+    if cursor is not None:
+        query = query.filter(key < tuple_(*cursor))
+
+    rows = (
+        query
+        .order_by(LoanApplication.created_at.desc(), LoanApplication.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    return _keyset_page(rows, limit)
+
+
+def list_pending_loans_page(session, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of the pending queue, oldest first.
+    Returns (loans, next_cursor); pass next_cursor back in to fetch the following page.
+    """
+    key = tuple_(LoanApplication.created_at, LoanApplication.id)
+    query = session.query(LoanApplication).filter(LoanApplication.status == LoanStatus.pending)
+    if cursor is not None:
+        query = query.filter(key > tuple_(*cursor))
+
+    rows = (
+        query
+        .order_by(LoanApplication.created_at.asc(), LoanApplication.id.asc())
+        .limit(limit + 1)
+        .all()
+    )
+    return _keyset_page(rows, limit)
+
+
 # --------------------------------------------
 # EDIT REQUEST
 # --------------------------------------------
+def list_pending_edit_requests(session):
+    """Pending edit/withdraw requests, oldest first, with their loans loaded in the same query."""
+    return (
+        session.query(EditRequest)
+        .options(joinedload(EditRequest.loan))
+        .filter(EditRequest.status == "pending")
+        .order_by(EditRequest.created_at.asc(), EditRequest.id.asc())
+        .all()
+    )
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when another session resolved some of the same requests mid-transaction."""
+
+
+def _apply_edits(data, req):
+    """application_data with the proposed edit applied (as a new dict)."""
+    data = dict(data)
+    if req.new_monthly_expenses is not None:
+        data["Monthly_Expenses"] = float(req.new_monthly_expenses)
+    if req.new_existing_loans is not None:
+        data["Existing_Loans"] = int(req.new_existing_loans)
+    if req.new_loan_tenure is not None:
+        data["Loan_Tenure_Months"] = int(req.new_loan_tenure)
+    return data
+
+
+def resolve_edit_requests(session, request_ids, approve, admin_id):
+    """
+    Approves or rejects many pending edit/withdraw requests in one transaction
+    using set-based UPDATEs and one batched set of audit entries.
+
+    Requests that are no longer pending (already handled by another admin) are
+    skipped. Claiming is optimistic: the status UPDATE only matches rows that
+    are still pending, and if another admin resolved one of them after we read
+    it, ConcurrentUpdateError is raised so the caller's transaction rolls back.
+    Approved withdrawals and edits move the fairness aggregates in the same
+    transaction.
+
+    Returns (applied_ids, skipped_ids).
+    """
+    request_ids = set(request_ids)
+    if not request_ids:
+        return [], []
+
+    # Sorted here rather than in SQL: the planner reaches these few rows through
+    # the status index, and ORDER BY id would add a temp B-tree sort
+    reqs = sorted(
+        session.query(EditRequest)
+        .filter(EditRequest.id.in_(request_ids), EditRequest.status == "pending"),
+        key=lambda req: req.id,
+    )
+    applied_ids = [req.id for req in reqs]
+    skipped_ids = sorted(request_ids - set(applied_ids))
+    if not reqs:
+        return [], skipped_ids
+
+    claimed = (
+        session.query(EditRequest)
+        .filter(EditRequest.id.in_(applied_ids), EditRequest.status == "pending")
+        .update({EditRequest.status: "approved" if approve else "rejected"}, synchronize_session=False)
+    )
+    if claimed != len(applied_ids):
+        raise ConcurrentUpdateError(
+            f"{len(applied_ids) - claimed} of the selected requests were resolved by someone else; please retry."
+        )
+
+    withdrawals = [req for req in reqs if req.withdraw_requested]
+    edits = [req for req in reqs if not req.withdraw_requested]
+
+    if approve:
+        # Affected loans as they are now, for the fairness aggregates
+        loans = {
+            row.id: row for row in
+            session.query(
+                LoanApplication.id, LoanApplication.data_version, LoanApplication.application_data,
+                LoanApplication.status, LoanApplication.score, LoanApplication.predicted_class,
+                *[getattr(LoanApplication, attr) for attr in fairness.FAIRNESS_ATTRIBUTES.values()]
+            )
+            .filter(LoanApplication.id.in_({req.loan_application_id for req in reqs}))
+        }
+        # loan id → (status, score, predicted_class) after this transaction
+        after = {loan.id: (loan.status, loan.score, loan.predicted_class) for loan in loans.values()}
+
+    if approve and withdrawals:
+        withdrawn_ids = {req.loan_application_id for req in withdrawals}
+        (
+            session.query(LoanApplication)
+            .filter(LoanApplication.id.in_(withdrawn_ids))
+            .update({LoanApplication.status: LoanStatus.withdrawn}, synchronize_session=False)
+        )
+        for loan_id in withdrawn_ids & after.keys():
+            after[loan_id] = (LoanStatus.withdrawn, *after[loan_id][1:])
+
+    if approve and edits:
+        changes = {}
+        for req in edits:  # ordered by id, so a later request wins
+            loan = loans.get(req.loan_application_id)
+            if loan is None:
+                continue
+            previous = changes.get(loan.id, {"application_data": loan.application_data})
+            new_data = _apply_edits(previous["application_data"], req)
+            changes[loan.id] = {
+                "id": loan.id,
+                "application_data": new_data,
+                # Bulk UPDATE skips the ORM sync hook, so set the typed columns here
+                **feature_values(new_data),
+                # New data version; the stored model output no longer applies
+                "data_version": (loan.data_version or 1) + 1,
+                "score": None,
+                "predicted_class": None,
+                "top_contributions": None,
+                "model_version": None,
+            }
+        if changes:
+            session.execute(update(LoanApplication), list(changes.values()))
+            enqueue_scoring(session, changes.keys())
+            for loan_id in changes:
+                after[loan_id] = (after[loan_id][0], None, None)
+
+    if approve:
+        # Withdrawn loans leave the decided counts; edited ones are unscored until the worker rescores them
+        fairness.record_changes(session, [
+            (
+                loans[loan_id],
+                fairness.loan_counters(loans[loan_id].status, loans[loan_id].score, loans[loan_id].predicted_class),
+                fairness.loan_counters(*state),
+            )
+            for loan_id, state in sorted(after.items())
+        ])
+
+    outcome = "Approved" if approve else "Rejected"
+    log_actions(session, admin_id, [
+        {
+            "action": f"{outcome} {kind} {req.id} for loan {req.loan_application_id}",
+            "verb": f"{'approve' if approve else 'reject'}_{kind}",
+            "target_type": "edit_request",
+            "target_id": req.id,
+        }
+        for req in reqs
+        for kind in ["withdraw" if req.withdraw_requested else "edit"]
+    ])
+
+    return applied_ids, skipped_ids
+
+
 def create_edit_request(session, **kwargs):
     req = EditRequest(**kwargs)
     session.add(req)
@@ -104,15 +348,69 @@ def create_edit_request(session, **kwargs):
     return req
 
 
+# --------------------------------------------
+# SCORING QUEUE
+# --------------------------------------------
+# A running job whose loan is edited meanwhile is put back in the queue by the
+# worker (scoring_worker._requeue_edited), so it counts as open here too
+OPEN_JOB_STATUSES = ("queued", "running")
+
+
+def enqueue_scoring(session, loan_ids):
+    """
+    Queues scoring jobs for the given loans (picked up by scoring_worker.py).
+    Loans that already have an open job are skipped. Returns the number queued.
+    """
+    loan_ids = set(loan_ids)
+    if not loan_ids:
+        return 0
+
+    already_open = {
+        loan_id for (loan_id,) in
+        session.query(ScoringJob.loan_application_id)
+        .filter(ScoringJob.loan_application_id.in_(loan_ids))
+        .filter(ScoringJob.status.in_(OPEN_JOB_STATUSES))
+    }
+
+    new_ids = sorted(loan_ids - already_open)
+    session.add_all([ScoringJob(loan_application_id=loan_id, status="queued") for loan_id in new_ids])
+    session.flush()
+    return len(new_ids)
+
+
 # --------------------------------------------
 # LOGGING
 # --------------------------------------------
-def log_action(session, user_id, action: str):
+def log_action(session, user_id, action: str, verb=None, target_type=None, target_id=None):
     """
-    Saves an audit log entry.
+    Saves an audit log entry as part of the caller's transaction
+    (written asynchronously after commit, see audit.py).
+
+    `verb`, `target_type` and `target_id` make the event queryable,
+    e.g. verb="submit", target_type="loan", target_id=loan.id.
     """
     if not action:
         return
 
-    log = AuditLog(user_id=user_id, action=action)
-    session.add(log)
+    log_actions(session, user_id, [
+        {"action": action, "verb": verb, "target_type": target_type, "target_id": target_id}
+    ])
+
+
+def log_actions(session, user_id, actions):
+    """
+    Saves many audit log entries with a single bulk INSERT.
+    Each action is either the text or a dict of action/verb/target_type/target_id.
+    """
+    entries = []
+    for action in actions:
+        event = action if isinstance(action, dict) else {"action": action}
+        if event.get("action"):
+            entries.append({
+                "user_id": user_id,
+                "action": event["action"],
+                "verb": event.get("verb"),
+                "target_type": event.get("target_type"),
+                "target_id": event.get("target_id"),
+            })
+    audit.record(session, entries)
@@ -0,0 +1,145 @@
+"""
+Served model version and its pickle-free artifacts.
+
+This is the light half of analysis.py: it knows which model version the
+process serves (model_store.py), loads the exported linear model
+(linear_model.json + memory-mapped .npy) and the drift reference, and
+scores draft applications in-process for the applicant preview. It imports
+neither pandas nor sklearn, and joblib only when a pickled artifact is
+actually requested, so the plain-user page can use it without pulling in
+the analyst stack.
+"""
+
+import json
+import os
+from functools import lru_cache
+
+from artifacts import ArtifactRegistry, load_artifact, registry
+from compiled_model import CompiledLinearModel
+from model_store import ModelStore
+
+
+# -------------------------
+# File paths for artifacts
+# -------------------------
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+
+# File names inside the served model version (see model_store.py)
+MODEL_FILE = "model.joblib"
+EXPLAINER_FILE = "explainer.joblib"
+FEATURE_NAMES_FILE = "feature_names.joblib"
+NUMERICAL_COLS_FILE = "numerical_cols.joblib"
+CATEGORICAL_COLS_FILE = "categorical_cols.joblib"
+BACKGROUND_MEAN_FILE = "background_mean.joblib"
+# Pickle-free export of linear models: JSON manifest + memory-mapped .npy arrays
+COMPILED_MODEL_FILE = "linear_model.json"
+# Training-time feature/score histograms for drift monitoring (see drift.py)
+DRIFT_REFERENCE_FILE = "drift_reference.json"
+
+
+# -------------------------
+# Load helpers
+# -------------------------
+def _prewarm(directory):
+    """Loads a model version's artifacts before it starts serving requests."""
+    if compiled_registry.get(os.path.join(directory, COMPILED_MODEL_FILE)) is not None:
+        return  # nothing gets unpickled for this version
+    from analysis import compiled_model_for
+
+    for name in (MODEL_FILE, FEATURE_NAMES_FILE, NUMERICAL_COLS_FILE, CATEGORICAL_COLS_FILE, BACKGROUND_MEAN_FILE):
+        load_artifact(os.path.join(directory, name))
+    compiled_model_for(load_artifact(os.path.join(directory, MODEL_FILE)))
+
+
+def _retire(directory):
+    registry.evict_dir(directory)
+    compiled_registry.evict_dir(directory)
+    json_registry.evict_dir(directory)
+
+
+def _load_json(path):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+# linear_model.json is not a joblib pickle, so it gets its own registry/loader
+compiled_registry = ArtifactRegistry(loader=CompiledLinearModel.load)
+json_registry = ArtifactRegistry(loader=_load_json)
+
+# Serves models/<version>/ named by models/CURRENT, or the flat legacy layout
+model_store = ModelStore(MODEL_DIR, warm=_prewarm, retire=_retire)
+
+
+def artifact_path(name):
+    """Path of an artifact in the model version this process currently serves."""
+    return os.path.join(model_store.active_dir(), name)
+
+
+# All loaders go through the process-wide artifact registry, so each file is
+# unpickled once per process and reloaded only when its content changes.
+def load_model():
+    """Load trained model pipeline"""
+    return load_artifact(artifact_path(MODEL_FILE))
+
+
+def load_exported_model():
+    """The pickle-free CompiledLinearModel of the served version, if it ships one."""
+    return compiled_registry.get(artifact_path(COMPILED_MODEL_FILE))
+
+
+def model_version():
+    """
+    Identifier of the served model: its version id in the versioned store,
+    or a short content hash of a legacy flat model.joblib; None without a model.
+    Stored next to persisted scores so they are recomputed when the model changes.
+    """
+    version = model_store.active_version()
+    if version is not None:
+        return version
+    if load_exported_model() is not None:
+        sha256 = compiled_registry.sha256(artifact_path(COMPILED_MODEL_FILE))
+    elif load_model() is not None:
+        sha256 = registry.sha256(artifact_path(MODEL_FILE))
+    else:
+        return None
+    return sha256[:12] if sha256 else None
+
+
+def load_drift_reference():
+    """Drift reference histograms saved with the served model version, if any."""
+    return json_registry.get(artifact_path(DRIFT_REFERENCE_FILE))
+
+
+# -------------------------
+# Applicant preview
+# -------------------------
+# Rounding applied to draft inputs so nearby widget positions share a cache entry
+PREVIEW_QUANTUM = {"Loan_Amount": 1000, "Annual_Income": 10000, "Monthly_Expenses": 500, "Credit_Score": 5}
+
+
+def quantize_application(application) -> tuple:
+    """Hashable, rounded (feature, value) tuple for a draft application dict."""
+    return tuple(sorted(
+        (key, round(value / PREVIEW_QUANTUM[key]) * PREVIEW_QUANTUM[key] if key in PREVIEW_QUANTUM else value)
+        for key, value in application.items()
+    ))
+
+
+@lru_cache(maxsize=4096)
+def _estimate_cached(version, quantized):
+    compiled = load_exported_model()
+    if compiled is None or model_version() != version:
+        return None
+    return float(compiled.predict_proba(compiled.encode_one(dict(quantized)))[0])
+
+
+def estimate_approval_probability(application):
+    """
+    Approval likelihood for a draft application, scored in-process with the
+    exported linear model and memoized per model version on the quantized
+    inputs. None when the served version has no linear_model.json; the
+    pickled pipeline is never loaded for this.
+    """
+    if load_exported_model() is None:
+        return None
+    return _estimate_cached(model_version(), quantize_application(application))
@@ -1,5 +1,4 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 import urllib.parse
 
@@ -23,8 +22,38 @@ def info_card(title, body):
         st.write(body)
 
 
-def display_loans_table(loans):
-    """Displays a clean and readable loan history table."""
+def current_page_cursor(key):
+    """Cursor of the page currently shown for a keyset-paginated listing (None = first page)."""
+    cursors = st.session_state.get(f"{key}_cursors", [])
+    return cursors[-1] if cursors else None
+
+
+def page_controls(key, next_cursor):
+    """
+    Previous/next controls for a keyset-paginated listing.
+    The cursors of visited pages are kept as a stack in session_state.
+    """
+    state_key = f"{key}_cursors"
+    cursors = st.session_state.setdefault(state_key, [])
+
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        if st.button("← Previous", key=f"{key}_prev", disabled=not cursors):
+            cursors.pop()
+            st.rerun()
+    with page_col:
+        st.caption(f"Page {len(cursors) + 1}")
+    with next_col:
+        if st.button("Next →", key=f"{key}_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+
+
+def display_loans_table(loans, page_key=None, next_cursor=None):
+    """
+    Displays a clean and readable loan history table.
+    Pass page_key (and the next_cursor from a *_page service call) to show page controls.
+    """
     rows = []
     for l in loans:
         rows.append({
@@ -36,11 +65,16 @@ def display_loans_table(loans):
         })
 
     if rows:
+        import pandas as pd  # lazy: keeps pandas off the cold-start path for plain users
+
         df = pd.DataFrame(rows)
         st.dataframe(df, use_container_width=True)
     else:
         st.info("No records to display.")
 
+    if page_key is not None:
+        page_controls(page_key, next_cursor)
+
 
 def logout_button():
     """Provides a consistent logout experience using Auth0."""
@@ -1,14 +1,47 @@
 import streamlit as st
-from services import session_scope, save_loan, list_user_loans, create_edit_request, log_action
-from ui_components import page_header, display_loans_table
+from services import session_scope, save_loan, list_user_loans_page, create_edit_request, log_action
+from ui_components import page_header, display_loans_table, current_page_cursor
 from datetime import datetime
 
 
+FIELD_LABELS = {
+    "Monthly_Expenses": "Monthly expenses",
+    "Existing_Loans": "Existing loans",
+    "Loan_Tenure_Months": "Tenure (months)",
+    "Loan_Amount": "Loan amount (INR)",
+}
+
+
 def is_pending(loan):
     """Safe check for pending status regardless of enum/string."""
     return (str(getattr(loan.status, "value", loan.status)) == "pending")
 
 
+def is_denied(loan):
+    return (str(getattr(loan.status, "value", loan.status)) == "denied")
+
+
+def show_counterfactual(loan):
+    """Smallest change to the editable fields that the model would approve."""
+    from counterfactual import counterfactual_for
+
+    suggestion = counterfactual_for(loan.application_data)
+    if suggestion is None:
+        st.caption("No change to expenses, existing loans, tenure or amount alone would change the model's estimate.")
+        return
+
+    def fmt(value):
+        value = float(value)
+        return f"{int(value):,}" if value.is_integer() else f"{value:,.2f}"
+
+    for feature, (old, new) in suggestion["changes"].items():
+        st.write(f"- {FIELD_LABELS.get(feature, feature)}: {fmt(old)} → {fmt(new)}")
+    st.caption(
+        f"Estimated approval likelihood with these changes: {suggestion['probability']:.0%}. "
+        "Model estimate only — a new application is still reviewed by an analyst."
+    )
+
+
 def user_dashboard(user):
     page_header("User dashboard", "Submit loan applications and track them.")
 
@@ -17,35 +50,49 @@ def user_dashboard(user):
     # -----------------------------
     st.subheader("New application")
 
-    with st.form("new_app"):
-        loan_amount = st.number_input("Loan amount (INR)", min_value=1000, value=50000, step=1000)
-        loan_tenure = st.selectbox("Tenure (months)", [12, 24, 36, 48, 60], index=2)
-        employment = st.selectbox("Employment type", ["Salaried", "Self-Employed", "Freelancer"])
-        annual_income = st.number_input("Annual income (INR)", min_value=0, value=500000, step=10000)
-        credit_score = st.slider("Credit score", 300, 850, 650)
-        existing_loans = st.number_input("Existing loans", min_value=0, value=0)
-        monthly_expenses = st.number_input("Monthly expenses", min_value=0, value=20000)
-        gender = st.radio("Gender", ["Male", "Female"])
-        region = st.selectbox("Region", ["Urban", "Rural", "Semi-Urban"])
-        submitted = st.form_submit_button("Submit")
+    # Plain widgets rather than st.form, so the estimate follows every change
+    loan_amount = st.number_input("Loan amount (INR)", min_value=1000, value=50000, step=1000)
+    loan_tenure = st.selectbox("Tenure (months)", [12, 24, 36, 48, 60], index=2)
+    employment = st.selectbox("Employment type", ["Salaried", "Self-Employed", "Freelancer"])
+    annual_income = st.number_input("Annual income (INR)", min_value=0, value=500000, step=10000)
+    credit_score = st.slider("Credit score", 300, 850, 650)
+    existing_loans = st.number_input("Existing loans", min_value=0, value=0)
+    monthly_expenses = st.number_input("Monthly expenses", min_value=0, value=20000)
+    gender = st.radio("Gender", ["Male", "Female"])
+    region = st.selectbox("Region", ["Urban", "Rural", "Semi-Urban"])
+
+    application = {
+        "Loan_Amount": float(loan_amount),
+        "Loan_Tenure_Months": int(loan_tenure),
+        "Employment_Type": employment,
+        "Annual_Income": float(annual_income),
+        "Credit_Score": int(credit_score),
+        "Existing_Loans": int(existing_loans),
+        "Monthly_Expenses": float(monthly_expenses),
+        "Gender": gender,
+        "Region": region,
+    }
+
+    if st.toggle("Show estimate", value=True, key="show_estimate"):
+        # Pickle-free and pandas-free (serving.py), imported on first use
+        from serving import estimate_approval_probability
+
+        estimate = estimate_approval_probability(application)
+        if estimate is None:
+            st.caption("Estimate unavailable right now.")
+        else:
+            st.metric("Estimated approval likelihood", f"{estimate:.0%}")
+            st.caption("Estimate only — an analyst makes the final decision.")
+
+    submitted = st.button("Submit", type="primary")
 
     if submitted:
-        application = {
-            "Loan_Amount": float(loan_amount),
-            "Loan_Tenure_Months": int(loan_tenure),
-            "Employment_Type": employment,
-            "Annual_Income": float(annual_income),
-            "Credit_Score": int(credit_score),
-            "Existing_Loans": int(existing_loans),
-            "Monthly_Expenses": float(monthly_expenses),
-            "Gender": gender,
-            "Region": region,
-            "submitted_at": datetime.utcnow().isoformat()
-        }
+        application["submitted_at"] = datetime.utcnow().isoformat()
 
         with session_scope() as s:
             loan = save_loan(s, user.id, application)
-            log_action(s, user.id, f"Submitted application {loan.id}")
+            log_action(s, user.id, f"Submitted application {loan.id}",
+                       verb="submit", target_type="loan", target_id=loan.id)
 
         st.success(f"Submitted application ID: {loan.id}")
         st.rerun()
@@ -56,14 +103,24 @@ def user_dashboard(user):
     st.subheader("My applications")
 
     with session_scope() as s:
-        loans = list_user_loans(s, user.id)
+        loans, next_cursor = list_user_loans_page(s, user.id, cursor=current_page_cursor("my_loans"))
 
-    display_loans_table(loans)
+    display_loans_table(loans, page_key="my_loans", next_cursor=next_cursor)
+
+    # -----------------------------
+    # What-if for denied applications
+    # -----------------------------
+    denied_loans = [l for l in loans if is_denied(l)]
+    if denied_loans:
+        st.subheader("What could change the outcome (denied, current page)")
+        for loan in denied_loans:
+            with st.expander(f"Application {loan.id}"):
+                show_counterfactual(loan)
 
     # -----------------------------
     # Edit or Withdraw Requests
     # -----------------------------
-    st.subheader("Request edit or withdrawal (pending only)")
+    st.subheader("Request edit or withdrawal (pending only, current page)")
 
     pending_loans = [l for l in loans if is_pending(l)]
 
@@ -103,7 +160,8 @@ def user_dashboard(user):
                     withdraw_requested=False,
                     status="pending"
                 )
-                log_action(s, user.id, f"Requested edit {req.id} for loan {loan.id}")
+                log_action(s, user.id, f"Requested edit {req.id} for loan {loan.id}",
+                           verb="request_edit", target_type="edit_request", target_id=req.id)
             st.success(f"Edit request sent for Application {loan.id}")
             st.rerun()
 
@@ -119,6 +177,7 @@ def user_dashboard(user):
                     withdraw_requested=True,
                     status="pending"
                 )
-                log_action(s, user.id, f"Requested withdraw {req.id} for loan {loan.id}")
+                log_action(s, user.id, f"Requested withdraw {req.id} for loan {loan.id}",
+                           verb="request_withdraw", target_type="edit_request", target_id=req.id)
             st.success(f"Withdrawal request sent for Application {loan.id}")
             st.rerun()